@@ -1,5 +1,13 @@
 import requests
 import os
+from requests.adapters import HTTPAdapter
+
+# Overridable so a local stub server can stand in for LINE in tests
+LINE_API_BASE = os.getenv("LINE_API_BASE", "https://api.line.me/v2/bot")
+
+# (connect, read) seconds for every LINE API call
+LINE_TIMEOUT = (float(os.getenv("LINE_CONNECT_TIMEOUT", 3.05)), float(os.getenv("LINE_READ_TIMEOUT", 10)))
+LINE_POOL_SIZE = int(os.getenv("LINE_POOL_SIZE", 4))
 
 class LINEMessagingService:
     """Service for sending LINE messages via Messaging API"""
@@ -12,59 +20,144 @@ class LINEMessagingService:
         "10": "ต.ค.", "11": "พ.ย.", "12": "ธ.ค."
     }
     
+    # Most recipients LINE accepts in one multicast request
+    MULTICAST_LIMIT = 500
+    
     def __init__(self):
         self.channel_access_token = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
-        self.api_base = "https://api.line.me/v2/bot"
+        self.api_base = LINE_API_BASE
         self.liff_url = os.getenv("LIFF_URL")
+
+        # One keep-alive pool per process instead of a new connection per call
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LINE_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         
         if not self.channel_access_token:
             print("⚠️ Warning: LINE_CHANNEL_ACCESS_TOKEN not set")
     
-    def send_broadcast(self, messages):
+    def send_broadcast(self, messages, retry_key=None):
         """
         Send broadcast message to all users
         
         Args:
             messages: List of message objects (max 5 messages)
+            retry_key: UUID sent as X-Line-Retry-Key; LINE accepts a given
+                key once, so resending after a timeout can't double-deliver
+            
+        Returns:
+            dict: Response from LINE API; "retryable" tells whether
+            trying again later could succeed
+        """
+        return self._send("broadcast", {"messages": messages}, retry_key)
+    
+    def send_multicast(self, to, messages, retry_key=None):
+        """
+        Send the same messages to specific users
+        
+        Args:
+            to: LINE user ids, at most MULTICAST_LIMIT
+            messages: List of message objects (max 5 messages)
+            retry_key: as for send_broadcast
             
         Returns:
-            dict: Response from LINE API
+            dict: as for send_broadcast
         """
+        if len(to) > self.MULTICAST_LIMIT:
+            return {"success": False, "error": f"multicast is limited to {self.MULTICAST_LIMIT} users", "retryable": False}
+        return self._send("multicast", {"to": list(to), "messages": messages}, retry_key)
+    
+    def _send(self, action, payload, retry_key=None):
         if not self.channel_access_token:
             return {"success": False, "error": "LINE_CHANNEL_ACCESS_TOKEN not configured"}
         
-        url = f"{self.api_base}/message/broadcast"
+        url = f"{self.api_base}/message/{action}"
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.channel_access_token}"
         }
-        
-        payload = {
-            "messages": messages
-        }
+        if retry_key:
+            headers["X-Line-Retry-Key"] = retry_key
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self.session.post(url, json=payload, headers=headers, timeout=LINE_TIMEOUT)
             
             if response.status_code == 200:
                 return {
                     "success": True,
-                    "message": "Broadcast sent successfully",
+                    "message": f"{action.capitalize()} sent successfully",
+                    "status": response.status_code,
                     "response": response.json() if response.text else {}
                 }
+            elif response.status_code == 409 and retry_key:
+                # An earlier attempt with this retry key was already accepted
+                return {
+                    "success": True,
+                    "message": f"{action.capitalize()} already accepted",
+                    "status": response.status_code,
+                    "response": {}
+                }
             else:
                 return {
                     "success": False,
                     "error": f"LINE API error: {response.status_code}",
-                    "details": response.text
+                    "status": response.status_code,
+                    "details": response.text,
+                    "retryable": response.status_code == 429 or response.status_code >= 500
                 }
                 
+        except requests.RequestException as e:
+            return {
+                "success": False,
+                "error": f"Failed to send {action}: {str(e)}",
+                "retryable": True
+            }
         except Exception as e:
             return {
                 "success": False,
-                "error": f"Failed to send broadcast: {str(e)}"
+                "error": f"Failed to send {action}: {str(e)}",
+                "retryable": False
             }
     
+    def build_slip_multicasts(self, slips, user_ids_by_account):
+        """
+        Multicast batches announcing the given slips to their owners
+        
+        Args:
+            slips: (accountNumber, year, month) of slips just inserted or updated
+            user_ids_by_account: {accountNumber: [LINE user id, ...]}
+            
+        Returns:
+            list of (user ids, messages); users whose slips produce the same
+            message share batches of up to MULTICAST_LIMIT
+        """
+        recipients_by_month = {}
+        for account_number, year, month in slips:
+            for user_id in user_ids_by_account.get(account_number, ()):
+                recipients_by_month.setdefault((year, month), set()).add(user_id)
+        
+        batches = []
+        for (year, month), user_ids in sorted(recipients_by_month.items()):
+            messages = self.create_personal_slip_notification(month, year)
+            user_ids = sorted(user_ids)
+            for i in range(0, len(user_ids), self.MULTICAST_LIMIT):
+                batches.append((user_ids[i:i + self.MULTICAST_LIMIT], messages))
+        return batches
+    
+    def create_personal_slip_notification(self, month, year):
+        month_short = self.THAI_MONTHS_SHORT.get(month, month)
+        year_short = str(year)[-2:]
+        
+        text_message = f"สลิปเงินเดือน {month_short} {year_short} ของท่านพร้อมแล้ว สามารถตรวจสอบได้ที่ {self.liff_url}"
+        
+        return [
+            {
+                "type": "text",
+                "text": text_message
+            }
+        ]
+    
     def create_simple_slip_notification(self, month, year):
         # Get short month name (e.g., "ต.ค.")
         month_short = self.THAI_MONTHS_SHORT.get(month, month)
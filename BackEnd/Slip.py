@@ -83,7 +83,10 @@ def split_and_save_named_pdfs(input_path, output_base_dir):
             os.makedirs(target_folder, exist_ok=True)
 
             save_path = os.path.join(target_folder, f"{safe_name}.pdf")
-            new_doc.save(save_path)
+            # Subset fonts and drop/deflate objects so each file doesn't carry
+            # a full copy of the source page's Thai fonts
+            new_doc.subset_fonts()
+            new_doc.save(save_path, garbage=4, deflate=True, deflate_images=True, deflate_fonts=True)
             upload_to_drive(save_path, year, month, root_folder_id='1zcL_hN8n4QyoL2Uo9bd9nWyLZJuKhbow')
             new_doc.close()
 
@@ -140,7 +143,7 @@ def upload_to_drive(filepath, year, month, root_folder_id=None):
 
 
 # Example usage:
-input_pdf = "C:\Users\bangb\Desktop\S_PROJECT\BackEnd\uploads\สลีป มิ.ย.68.pdf"
+input_pdf = r"C:\Users\bangb\Desktop\S_PROJECT\BackEnd\uploads\สลีป มิ.ย.68.pdf"
 output_folder = "split_named_pdfs"
 split_and_save_named_pdfs(input_pdf, output_folder)
 
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+# How long a worker trusts its copy of the admin list without being told of changes
+ADMIN_CACHE_TTL = int(os.getenv("ADMIN_CACHE_TTL", 60))
+
+# Cross-worker sync: "auto" (change stream, polling if unsupported),
+# "watch", "poll" or "off" (TTL only)
+ADMIN_CACHE_SYNC = os.getenv("ADMIN_CACHE_SYNC", "auto")
+ADMIN_CACHE_POLL_SECONDS = int(os.getenv("ADMIN_CACHE_POLL_SECONDS", 5))
+
+# Server error code for $changeStream on a standalone mongod
+CHANGE_STREAM_UNSUPPORTED = 40573
+
+
+class AdminCache:
+    """
+    Per-process copy of the admin email set
+
+    The set is small, so the whole of it is loaded at once and membership
+    checks never query MongoDB while the copy is fresh. Writes through this
+    worker call invalidate(); writes through other workers reach it via the
+    sync thread, or at worst after ADMIN_CACHE_TTL seconds.
+    """
+
+    def __init__(self, collection, ttl: int = None):
+        self.collection = collection
+        self.ttl = ADMIN_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._emails: Optional[Set[str]] = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self.sync_mode = "off"
+        self._sync_pending = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def is_admin(self, email: str) -> bool:
+        if not email:
+            return False
+        with self._lock:
+            fresh = self._emails is not None and time.monotonic() - self._loaded_at <= self.ttl
+            if fresh:
+                self.hits += 1
+                return email in self._emails
+            self.misses += 1
+        return email in self.reload()
+
+    def reload(self) -> Set[str]:
+        with self._lock:
+            generation = self._generation
+            sync_mode, self._sync_pending = self._sync_pending, None
+        if sync_mode:
+            self._start_sync_thread(sync_mode)
+        emails = {doc["email"] for doc in self.collection.find({}, {"_id": 0, "email": 1})}
+        with self._lock:
+            # Don't install a read that started before an invalidation
+            if generation == self._generation:
+                self._emails = emails
+                self._loaded_at = time.monotonic()
+        return emails
+
+    def invalidate(self):
+        with self._lock:
+            self._emails = None
+            self._generation += 1
+            self.invalidations += 1
+
+    def start_sync(self, mode: str = None):
+        """
+        Keep this worker's copy current from a background thread
+
+        The thread starts with the first load, so a worker that never checks
+        an admin never opens a change stream.
+        """
+        mode = ADMIN_CACHE_SYNC if mode is None else mode
+        if mode != "off":
+            with self._lock:
+                self._sync_pending = mode
+
+    def _start_sync_thread(self, mode: str):
+        if mode == "poll":
+            target, args = self._poll, ()
+        else:
+            target, args = self._watch, (mode == "watch",)
+        threading.Thread(target=target, args=args, name="admin-cache-sync", daemon=True).start()
+
+    def _watch(self, required: bool):
+        self.sync_mode = "watch"
+        while True:
+            try:
+                with self.collection.watch() as stream:
+                    for _ in stream:
+                        self.invalidate()
+            except (OperationFailure, NotImplementedError) as e:
+                unsupported = isinstance(e, NotImplementedError) or e.code == CHANGE_STREAM_UNSUPPORTED
+                if unsupported and not required:
+                    print("ℹ️ Change streams unavailable, polling admin list instead")
+                    return self._poll()
+                print(f"⚠️ Admin change stream failed: {e}")
+            except PyMongoError as e:
+                print(f"⚠️ Admin change stream failed: {e}")
+            # A change may have been missed while the stream was down
+            self.invalidate()
+            time.sleep(ADMIN_CACHE_POLL_SECONDS)
+
+    def _poll(self):
+        self.sync_mode = "poll"
+        while True:
+            time.sleep(ADMIN_CACHE_POLL_SECONDS)
+            try:
+                self.reload()
+            except PyMongoError as e:
+                print(f"⚠️ Admin list poll failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "admins": len(self._emails) if self._emails is not None else None,
+                "ttl": self.ttl,
+                "sync": self.sync_mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -1,25 +1,56 @@
-from flask import Flask, request, jsonify,send_file
-from flask_cors import CORS
-from pymongo import MongoClient
-from bson import ObjectId, Binary
 import os
-from datetime import datetime
 from dotenv import load_dotenv
-import base64
-from pdf_processor import PDFProcessor
-import io
-# Load .env file BEFORE using os.getenv
+# Load .env file BEFORE importing modules that read os.getenv at import time
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
+from flask import Blueprint, Flask, Response, current_app, request, jsonify
+from werkzeug.wsgi import wrap_file
+from flask_cors import CORS
+from bson import ObjectId
+from pymongo import WriteConcern
+from datetime import datetime, timedelta
+import base64
+from mongo import LazyMongo
+from slip_ingestor import SlipIngestor
+from job_queue import JobQueue, JobProgress
+from ingest_cache import IngestCache
+from slip_blob_store import SlipBlobStore
+from slip_cache import SlipCache
+from single_flight import SingleFlight
+from month_catalog import MonthCatalog
+from slip_counters import SlipCounters
+from search_index import SoldierSearchIndex
+from admin_cache import AdminCache
+from line_outbox import LineOutbox
+from line_users import LineUsers
+from deduction_store import DeductionStore
+from zip_stream import iter_zip
+from pagination import CursorError, after_filter, decode_cursor, open_page, parse_limit, stream_page
+import io
+import uuid
+import hashlib
+import re
+import time
+from urllib.parse import quote
 from Line_messaging import LINEMessagingService
-# Initialize LINE service after app initialization
-line_service = LINEMessagingService()
-app = Flask(__name__)
+
+# Routes live on a blueprint; create_app() builds the Flask app around it
+api = Blueprint("api", __name__)
+
+_line_service = None
+
+
+def get_line_service() -> LINEMessagingService:
+    """LINE client, built on the first broadcast rather than at import"""
+    global _line_service
+    if _line_service is None:
+        _line_service = LINEMessagingService()
+    return _line_service
+
 
 # More flexible CORS configuration
-@app.after_request
-def after_request(response):
-    origin = request.headers.get('Origin')
+def cors_headers(origin) -> dict:
+    """CORS headers for a request Origin; empty when the origin isn't allowed"""
     # Allow requests from Netlify, Cloudflare Pages, and localhost
     if origin and (
         origin.endswith('.netlify.app') or 
@@ -28,10 +59,20 @@ def after_request(response):
         origin == 'https://dev.finance-cpn.pages.dev' or
         origin.startswith('http://localhost')
     ):
-        response.headers['Access-Control-Allow-Origin'] = origin
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+        return {
+            'Access-Control-Allow-Origin': origin,
+            'Access-Control-Allow-Credentials': 'true',
+            'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, Authorization, Accept, If-None-Match, Range',
+            'Access-Control-Expose-Headers': ', '.join(
+                ['ETag', 'Content-Disposition', 'Content-Range', 'Accept-Ranges', *SLIP_METADATA_HEADERS]
+            )
+        }
+    return {}
+
+
+def after_request(response):
+    response.headers.update(cors_headers(request.headers.get('Origin')))
     return response
 
 # MongoDB connection
@@ -41,29 +82,236 @@ DB_NAME = os.getenv("DB_NAME", "payslip_system")
 if not MONGO_URI:
     raise ValueError("❌ Missing MONGO_URI in environment variables")
 
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    client.admin.command("ping")  # test connection
-    print("✅ Connected to MongoDB successfully")
-except Exception as e:
-    print("❌ MongoDB connection failed:", str(e))
-    raise e
-
-db = client[DB_NAME]
+# Nothing connects until the first query; /api/health pings the server
+db = LazyMongo(MONGO_URI, DB_NAME)
 
 ##ADMIN##
 admins_collection = db["admins"]
-admins_collection.create_index([("email", 1)], unique=True)
+admin_cache = AdminCache(admins_collection)
 
 ##SLIPS##
 payslips_collection = db["payslips"]
-payslips_collection.create_index([("accountNumber", 1)])
-payslips_collection.create_index([("year", 1), ("month", 1)])
-payslips_collection.create_index(
-    [("accountNumber", 1), ("year", 1), ("month", 1)], unique=True
-)
 
-@app.route("/api/admin/check", methods=["POST"])
+##SLIP PDF BLOBS##
+blob_store = SlipBlobStore(db)
+slip_cache = SlipCache()
+single_flight = SingleFlight()
+
+##MONTH CATALOG##
+month_catalog = MonthCatalog(db["month_catalog"], payslips_collection)
+
+##STATS COUNTERS##
+slip_counters = SlipCounters(db["counters"], db["accounts"], payslips_collection)
+
+##SEARCH INDEX##
+search_index = SoldierSearchIndex(db["soldier_search"], payslips_collection)
+
+
+def on_slips_written(inserted, updated):
+    """Keep derived collections in step with each ingested batch"""
+    deltas = {}
+    for slip_data in inserted:
+        month_key = (slip_data["year"], slip_data["month"])
+        deltas[month_key] = deltas.get(month_key, 0) + 1
+    month_catalog.apply(deltas)
+    slip_counters.add_slips(slip_data["accountNumber"] for slip_data in inserted)
+    search_index.add_slips(inserted + updated)
+
+# Metadata headers sent with binary /api/get-slip responses
+SLIP_METADATA_HEADERS = {
+    "X-Slip-Name": "name",
+    "X-Slip-Rank": "rank",
+    "X-Slip-Account": "accountNumber",
+    "X-Slip-Year": "year",
+    "X-Slip-Month": "month",
+}
+
+
+def open_slip_pdf(slip):
+    """File-like PDF for a slip: bytes already loaded (cache or unmigrated document) or the blob store"""
+    if "pdfData" in slip:
+        return io.BytesIO(slip["pdfData"])
+    if slip.get("pdfHash"):
+        return blob_store.open(slip["pdfHash"])
+    return None
+
+
+def find_slip(account: str, year: str, month: str):
+    """
+    Slip document through the per-worker LRU cache
+
+    A cached slip carries its PDF bytes in pdfData. On a miss only the
+    payslip document is read; slip_pdf() fetches the blob if the bytes are
+    actually sent, so a 304 revalidation never opens it.
+    """
+    key = SlipCache.key(account, year, month)
+    slip = slip_cache.get(key)
+    if slip:
+        return slip
+
+    # Concurrent misses for the same slip (e.g. right after a broadcast)
+    # share one query
+    return single_flight.do(("slip",) + key, lambda: load_slip(key))
+
+
+def load_slip(key):
+    slip = payslips_collection.find_one({
+        "accountNumber": key[0],
+        "year": key[1],
+        "month": key[2]
+    })
+    # Documents not yet moved to the blob store already hold their bytes
+    if slip and "pdfData" in slip:
+        slip_cache.put(key, slip)
+    return slip
+
+
+def has_pdf(slip) -> bool:
+    return "pdfData" in slip or bool(slip.get("pdfHash"))
+
+
+def slip_pdf(slip) -> bytes:
+    """PDF bytes of a slip from find_slip(), read from the blob store and cached on first use"""
+    if "pdfData" in slip:
+        return slip["pdfData"]
+
+    key = SlipCache.key(slip["accountNumber"], slip["year"], slip["month"])
+
+    def load() -> bytes:
+        pdf_bytes = blob_store.read(slip["pdfHash"])
+        slip_cache.put(key, dict(slip, pdfData=pdf_bytes))
+        return pdf_bytes
+
+    return single_flight.do(("pdf",) + key, load)
+
+
+def slip_pdf_response(slip, filename: str, as_attachment: bool = True):
+    """
+    Raw PDF response for a slip
+
+    slip comes from find_slip(). Sends a strong ETag (the content hash),
+    answers If-None-Match with 304 from the payslip document alone, before
+    any blob is read, and supports byte ranges for in-app viewers.
+    """
+    etag = slip.get("pdfHash") or SlipBlobStore.content_hash(slip["pdfData"])
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    pdf_bytes = slip_pdf(slip)
+    size = len(pdf_bytes)
+
+    # BytesIO over the cached bytes shares the buffer rather than copying it;
+    # make_conditional slices it for Range requests
+    response = current_app.response_class(
+        wrap_file(request.environ, io.BytesIO(pdf_bytes)),
+        mimetype='application/pdf',
+        direct_passthrough=True
+    )
+    response.content_length = size
+    response.headers.set(
+        "Content-Disposition",
+        "attachment" if as_attachment else "inline",
+        filename=filename
+    )
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+
+    return response.make_conditional(request, accept_ranges=True, complete_length=size)
+
+
+def slip_metadata_headers(slip) -> dict:
+    """Slip metadata as X-Slip-* headers, percent-encoded UTF-8 (names are Thai)"""
+    return {
+        header: quote(str(slip.get(field) or ""))
+        for header, field in SLIP_METADATA_HEADERS.items()
+    }
+
+##JOBS##
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(BASE_DIR, "uploads"))
+job_queue = JobQueue(db["jobs"])
+
+##INGEST CACHE##
+ingest_cache = IngestCache(db["ingested_documents"])
+
+##DEDUCTIONS##
+deduction_store = DeductionStore(db["deductions"])
+
+##LINE OUTBOX##
+# "multicast": only owners of new/updated slips; "broadcast": every follower;
+# "auto": multicast when every owner in the upload has a linked LINE user, else broadcast
+LINE_NOTIFY_MODE = os.getenv("LINE_NOTIFY_MODE", "auto")
+
+line_users = LineUsers(db["line_users"])
+
+
+def send_line_message(message: dict) -> dict:
+    """Deliver one outbox message through the LINE API"""
+    if message["kind"] == "multicast":
+        return get_line_service().send_multicast(message["to"], message["messages"], message["retryKey"])
+    return get_line_service().send_broadcast(message["messages"], message["retryKey"])
+
+
+line_outbox = LineOutbox(db["line_outbox"], send_line_message, db["line_deliveries"])
+
+
+def queue_slip_notifications(written: list, year: str, month: str):
+    """Queue LINE notices for slips just inserted or updated, given as (account, year, month)"""
+    multicast = False
+    if LINE_NOTIFY_MODE != "broadcast":
+        accounts = {account for account, _, _ in written}
+        recipients = line_users.user_ids_by_account(accounts)
+        # Decided per upload: a soldier without a linked LINE user would
+        # miss a multicast, so "auto" broadcasts unless every owner is linked
+        multicast = LINE_NOTIFY_MODE == "multicast" or len(recipients) == len(accounts)
+
+    if not multicast:
+        messages = get_line_service().create_simple_slip_notification(month, year)
+        if line_outbox.enqueue(f"slip-notice:{year}-{month}", "broadcast", messages):
+            print(f"📨 Broadcast queued for {month}/{year}")
+        else:
+            print(f"ℹ️ Broadcast for {month}/{year} was already queued")
+        return
+
+    batches = get_line_service().build_slip_multicasts(written, recipients)
+    queued = 0
+    for to, messages in batches:
+        # Same recipients and month means the same notice; queue it once
+        digest = hashlib.sha1(",".join(to).encode("utf-8")).hexdigest()[:16]
+        if line_outbox.enqueue(f"slip-notice:{year}-{month}:{digest}", "multicast", messages, to=to):
+            queued += 1
+    print(f"📨 {queued} multicast batch(es) queued for {month}/{year} "
+          f"({sum(len(to) for to, _ in batches)} LINE users)")
+
+
+def ensure_indexes():
+    """Create every index the API relies on; safe to run repeatedly (see migrate.py)"""
+    admins_collection.create_index([("email", 1)], unique=True)
+
+    payslips_collection.create_index([("accountNumber", 1)])
+    payslips_collection.create_index([("year", 1), ("month", 1)])
+    payslips_collection.create_index(
+        [("accountNumber", 1), ("year", 1), ("month", 1)], unique=True
+    )
+    payslips_collection.create_index([("pdfHash", 1)])
+    # Keyset pagination for /api/files/list, one per filter combination it serves
+    payslips_collection.create_index([("uploadedAt", -1), ("_id", -1)])
+    payslips_collection.create_index([("year", 1), ("month", 1), ("uploadedAt", -1), ("_id", -1)])
+    payslips_collection.create_index([("accountNumber", 1), ("uploadedAt", -1), ("_id", -1)])
+    # Batched month deletion walks a month in _id order
+    payslips_collection.create_index([("year", 1), ("month", 1), ("_id", 1)])
+
+    search_index.ensure_indexes()
+    job_queue.ensure_indexes()
+    ingest_cache.ensure_indexes()
+    line_outbox.ensure_indexes()
+    line_users.ensure_indexes()
+    deduction_store.ensure_indexes()
+
+
+@api.route("/api/admin/check", methods=["POST"])
 def check_admin():
     """Check if email is admin"""
     try:
@@ -73,18 +321,16 @@ def check_admin():
         if not email:
             return jsonify({"success": False, "error": "ไม่พบอีเมล"}), 400
         
-        admin = admins_collection.find_one({"email": email})
-        
         return jsonify({
             "success": True,
-            "isAdmin": admin is not None
+            "isAdmin": admin_cache.is_admin(email)
         })
     
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/admin/list", methods=["GET"])
+@api.route("/api/admin/list", methods=["GET"])
 def list_admins():
     """List all admin emails"""
     try:
@@ -103,7 +349,7 @@ def list_admins():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/admin/add", methods=["POST"])
+@api.route("/api/admin/add", methods=["POST"])
 def add_admin():
     """Add new admin email"""
     try:
@@ -115,7 +361,7 @@ def add_admin():
             return jsonify({"success": False, "error": "กรุณาระบุอีเมล"}), 400
         
         # Check if requester is admin
-        if not admins_collection.find_one({"email": requester_email}):
+        if not admin_cache.is_admin(requester_email):
             return jsonify({"success": False, "error": "ไม่มีสิทธิ์เพิ่ม Admin"}), 403
         
         # Check if already exists
@@ -126,6 +372,7 @@ def add_admin():
             "email": email,
             "addedAt": datetime.utcnow()
         })
+        admin_cache.invalidate()
         
         return jsonify({
             "success": True,
@@ -136,7 +383,7 @@ def add_admin():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/admin/remove", methods=["DELETE"])
+@api.route("/api/admin/remove", methods=["DELETE"])
 def remove_admin():
     """Remove admin email"""
     try:
@@ -147,7 +394,7 @@ def remove_admin():
             return jsonify({"success": False, "error": "กรุณาระบุอีเมล"}), 400
         
         # Check if requester is admin
-        if not admins_collection.find_one({"email": requester_email}):
+        if not admin_cache.is_admin(requester_email):
             return jsonify({"success": False, "error": "ไม่มีสิทธิ์ลบ Admin"}), 403
         
         # Prevent removing yourself
@@ -155,6 +402,7 @@ def remove_admin():
             return jsonify({"success": False, "error": "ไม่สามารถลบตัวเองได้"}), 400
         
         result = admins_collection.delete_one({"email": email})
+        admin_cache.invalidate()
         
         if result.deleted_count > 0:
             return jsonify({
@@ -169,7 +417,71 @@ def remove_admin():
 
 
 
-@app.route("/api/upload-slip", methods=["POST"])
+def ingest_pdf(pdf_content: bytes, batch_size: int = None, progress: JobProgress = None,
+               content_hash: str = None, file_name: str = None) -> dict:
+    """Split, store and announce one uploaded payslip PDF"""
+    # Imported here so workers that never take an upload never load PyMuPDF
+    from pdf_processor import PDFProcessor
+
+    processor = PDFProcessor()
+
+    # Keys of every slip this upload inserted or updated, for LINE notices
+    written = []
+
+    def on_written(inserted, updated):
+        on_slips_written(inserted, updated)
+        written.extend(
+            (slip_data["accountNumber"], slip_data["year"], slip_data["month"])
+            for slip_data in inserted + updated
+        )
+
+    ingestor = SlipIngestor(payslips_collection, blob_store, batch_size=batch_size,
+                            on_written=on_written)
+
+    on_pages = None
+    if progress:
+        on_pages = lambda done, total: progress.update(pagesDone=done, pagesTotal=total)
+
+    def on_batch(result):
+        # Drop cached slips as soon as their batch is written
+        slip_cache.invalidate_month(result["year"], result["month"])
+        if progress:
+            progress.update(
+                slipsInserted=result["inserted"],
+                slipsUpdated=result["updated"],
+                slipsUnchanged=result["unchanged"]
+            )
+
+    # Slips are upserted in fixed-size batches as they are split, so only
+    # one batch of PDF bytes is held at a time
+    result = ingestor.ingest(processor.iter_slips(pdf_content, progress=on_pages), progress=on_batch)
+    if content_hash and result["total"]:
+        ingest_cache.record(content_hash, result, file_name)
+    notification_month, notification_year = result["month"], result["year"]
+
+    # Queue LINE notifications unless nothing changed; the outbox sends
+    # them in the background
+    if notification_month and notification_year and written:
+        queue_slip_notifications(written, notification_year, notification_month)
+
+    return result
+
+
+def run_upload_job(upload_path: str, batch_size: int = None, content_hash: str = None,
+                   file_name: str = None):
+    """Job body for an asynchronous upload; removes the saved file when done"""
+    def run(progress: JobProgress) -> dict:
+        try:
+            with open(upload_path, "rb") as f:
+                pdf_content = f.read()
+            return ingest_pdf(pdf_content, batch_size=batch_size, progress=progress,
+                              content_hash=content_hash, file_name=file_name)
+        finally:
+            os.remove(upload_path)
+    return run
+
+
+@api.route("/api/upload-slip", methods=["POST"])
 def upload_slip():
     try:
         if "file" not in request.files:
@@ -183,70 +495,126 @@ def upload_slip():
         if not file.filename.lower().endswith(".pdf"):
             return jsonify({"success": False, "error": "กรุณาอัปโหลดไฟล์ PDF เท่านั้น"}), 400
 
-        pdf_content = file.read()
-
-        processor = PDFProcessor()
-        extracted_slips = processor.process_pdf(pdf_content)
+        batch_size = request.form.get("batchSize", type=int)
+        force = request.values.get("force", "").lower() in ("1", "true")
 
-        inserted_count, updated_count = 0, 0
-        
-        # Track the month and year for notification
-        notification_month = None
-        notification_year = None
-
-        for slip_data in extracted_slips:
-            # Store PDF as Binary BSON type for MongoDB
-            slip_data["pdfData"] = Binary(slip_data["pdfData"])
-            slip_data["uploadedAt"] = datetime.utcnow()
-            
-            # Capture month and year for notification
-            if not notification_month:
-                notification_month = slip_data["month"]
-                notification_year = slip_data["year"]
-            
-            existing = payslips_collection.find_one({
-                "accountNumber": slip_data["accountNumber"],
-                "year": slip_data["year"],
-                "month": slip_data["month"]
+        # Identical bytes were already ingested: nothing to do unless forced
+        content_hash = IngestCache.hash_stream(file.stream)
+        previous = None if force else ingest_cache.lookup(content_hash)
+        if previous:
+            return jsonify({
+                "success": True,
+                "skipped": True,
+                "message": f"ไฟล์นี้ถูกอัปโหลดแล้ว ({previous['slipCount']} รายการ)",
+                "inserted": 0,
+                "updated": 0,
+                "unchanged": previous["slipCount"],
+                "total": previous["slipCount"],
+                "year": previous["year"],
+                "month": previous["month"]
             })
 
-            if existing:
-                payslips_collection.update_one(
-                    {"_id": existing["_id"]},
-                    {"$set": slip_data}
-                )
-                updated_count += 1
-            else:
-                payslips_collection.insert_one(slip_data)
-                inserted_count += 1
-
-        # Send simple broadcast notification to all users
-        if notification_month and notification_year:
-            messages = line_service.create_simple_slip_notification(
-                notification_month, 
-                notification_year
+        # Async mode: save the upload, hand it to the job queue and return at once
+        if request.values.get("async", "").lower() in ("1", "true"):
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            upload_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.pdf")
+            file.save(upload_path)
+
+            job_id = job_queue.submit(
+                "upload-slip",
+                run_upload_job(upload_path, batch_size, content_hash, file.filename),
+                params={"fileName": file.filename},
+                files=[upload_path]
             )
-            
-            broadcast_result = line_service.send_broadcast(messages)
-            
-            if broadcast_result.get("success"):
-                print(f"✅ Broadcast sent successfully for {notification_month}/{notification_year}")
-            else:
-                print(f"⚠️ Broadcast failed: {broadcast_result.get('error')}")
+            return jsonify({
+                "success": True,
+                "jobId": job_id,
+                "statusUrl": f"{request.host_url}api/jobs/{job_id}"
+            }), 202
+
+        result = ingest_pdf(file.read(), batch_size=batch_size,
+                            content_hash=content_hash, file_name=file.filename)
 
         return jsonify({
             "success": True,
-            "message": f"อัปโหลดสำเร็จ: เพิ่มใหม่ {inserted_count} รายการ, อัปเดต {updated_count} รายการ",
-            "inserted": inserted_count,
-            "updated": updated_count,
-            "total": len(extracted_slips)
+            "message": (
+                f"อัปโหลดสำเร็จ: เพิ่มใหม่ {result['inserted']} รายการ, "
+                f"อัปเดต {result['updated']} รายการ, ไม่เปลี่ยนแปลง {result['unchanged']} รายการ"
+            ),
+            "inserted": result["inserted"],
+            "updated": result["updated"],
+            "unchanged": result["unchanged"],
+            "total": result["total"]
         })
 
     except Exception as e:
         return jsonify({"success": False, "error": f"เกิดข้อผิดพลาด: {str(e)}"}), 500
 
 
-@app.route("/api/get-slip", methods=["POST"])
+@api.route("/api/deductions/upload", methods=["POST"])
+def upload_deductions():
+    """Load a month's loan.txt deduction file into the deductions collection"""
+    try:
+        if "file" not in request.files:
+            return jsonify({"success": False, "error": "ไม่พบไฟล์ที่อัปโหลด"}), 400
+
+        file = request.files["file"]
+        year = request.form.get("year")
+        month = request.form.get("month")
+
+        if file.filename == "":
+            return jsonify({"success": False, "error": "ไม่ได้เลือกไฟล์"}), 400
+
+        if not file.filename.lower().endswith(".txt"):
+            return jsonify({"success": False, "error": "กรุณาอัปโหลดไฟล์ .txt เท่านั้น"}), 400
+
+        if not all([year, month]):
+            return jsonify({"success": False, "error": "กรุณาระบุปีและเดือน"}), 400
+
+        # NumPy is only needed here, so importing the app stays light
+        from deduction_file import parse_deduction_file
+
+        try:
+            table = parse_deduction_file(file.read())
+        except ValueError as e:
+            return jsonify({"success": False, "error": f"อ่านไฟล์ไม่สำเร็จ: {str(e)}"}), 400
+
+        result = deduction_store.load(table, str(year), str(month).zfill(2))
+
+        return jsonify({
+            "success": True,
+            "message": f"อัปโหลดสำเร็จ: เพิ่มใหม่ {result['inserted']} รายการ, อัปเดต {result['updated']} รายการ",
+            "inserted": result["inserted"],
+            "updated": result["updated"],
+            "total": result["total"],
+            "codes": result["codes"]
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "error": f"เกิดข้อผิดพลาด: {str(e)}"}), 500
+
+
+@api.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Report status and progress of a background job"""
+    try:
+        job = job_queue.get(job_id)
+
+        if not job:
+            return jsonify({"success": False, "error": "ไม่พบงาน"}), 404
+
+        job["jobId"] = job.pop("_id")
+        for field in ("createdAt", "startedAt", "finishedAt"):
+            if field in job:
+                job[field] = job[field].isoformat()
+
+        return jsonify({"success": True, "job": job})
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api.route("/api/get-slip", methods=["POST"])
 def get_slip():
     try:
         data = request.get_json(force=True)
@@ -257,20 +625,26 @@ def get_slip():
         if not all([account, year, month]):
             return jsonify({"success": False, "error": "กรุณาระบุข้อมูลให้ครบถ้วน"}), 400
 
-        slip = payslips_collection.find_one({
-            "accountNumber": account,
-            "year": str(year),
-            "month": str(month).zfill(2)
-        })
+        slip = find_slip(account, year, month)
 
         if not slip:
             return jsonify({"success": False, "error": "ไม่พบสลิปเงินเดือน"}), 404
 
-        if "pdfData" in slip:
-            # Convert Binary/bytes to base64
-            pdf_bytes = slip["pdfData"]
-            if isinstance(pdf_bytes, Binary):
-                pdf_bytes = bytes(pdf_bytes)
+        # Binary mode: raw PDF with metadata in X-Slip-* headers, no base64.
+        # JSON stays the default for older LIFF clients.
+        wants_pdf = (
+            data.get("format") == "pdf" or
+            request.args.get("format") == "pdf" or
+            request.accept_mimetypes.best_match(["application/json", "application/pdf"]) == "application/pdf"
+        )
+        if wants_pdf and has_pdf(slip):
+            filename = f"slip_{account}_{month}_{year}.pdf"
+            response = slip_pdf_response(slip, filename, as_attachment=False)
+            response.headers.update(slip_metadata_headers(slip))
+            return response
+
+        if has_pdf(slip):
+            pdf_bytes = slip_pdf(slip)
             
             pdf_base64 = base64.b64encode(pdf_bytes).decode("utf-8")
             
@@ -292,22 +666,22 @@ def get_slip():
         return jsonify({"success": False, "error": f"เกิดข้อผิดพลาด: {str(e)}"}), 500
 
 
-@app.route("/api/available-months", methods=["GET"])
+def load_available_months() -> dict:
+    catalog = month_catalog.months()
+
+    data = {}
+    for year in sorted(catalog, reverse=True):
+        data[year] = sorted(catalog[year])
+    return data
+
+
+@api.route("/api/available-months", methods=["GET"])
 def get_available_months():
     try:
-        pipeline = [
-            {"$group": {"_id": {"year": "$year", "month": "$month"}}},
-            {"$group": {"_id": "$_id.year", "months": {"$push": "$_id.month"}}},
-            {"$sort": {"_id": -1}}
-        ]
-
-        results = list(payslips_collection.aggregate(pipeline))
+        if not month_catalog.is_built():
+            return jsonify({"success": False, "error": "รายการเดือนยังไม่พร้อม กรุณาลองใหม่ภายหลัง"}), 503
 
-        data = {}
-        for item in results:
-            year = item["_id"]
-            months = sorted(item["months"])
-            data[year] = months
+        data = single_flight.do("available-months", load_available_months)
 
         return jsonify({"success": True, "data": data})
 
@@ -315,14 +689,15 @@ def get_available_months():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/files/list", methods=["GET"])
+@api.route("/api/files/list", methods=["GET"])
 def list_files():
     try:
         query = {}
         year = request.args.get("year")
         month = request.args.get("month")
         account = request.args.get("account")
-        limit = int(request.args.get("limit", 100))
+        limit = parse_limit(request.args.get("limit"), 100)
+        cursor = request.args.get("cursor")
 
         if year:
             query["year"] = year
@@ -331,23 +706,43 @@ def list_files():
         if account:
             query["accountNumber"] = account
 
-        files = list(payslips_collection.find(
+        if cursor:
+            uploaded_at, file_id = decode_cursor(cursor, str, str)
+            if not ObjectId.is_valid(file_id):
+                raise CursorError("invalid cursor")
+            position = after_filter(
+                ("uploadedAt", datetime.fromisoformat(uploaded_at)),
+                ("_id", ObjectId(file_id))
+            )
+            query = {"$and": [query, position]} if query else position
+
+        # Read one past the page so stream_page knows whether there is more
+        files = open_page(payslips_collection.find(
             query,
             {"pdfData": 0}
-        ).sort("uploadedAt", -1).limit(limit))
-
-        for file in files:
-            file["_id"] = str(file["_id"])
-            if "uploadedAt" in file:
-                file["uploadedAt"] = file["uploadedAt"].isoformat()
+        ).sort([("uploadedAt", -1), ("_id", -1)]).limit(limit + 1).batch_size(min(limit + 1, 500)))
 
-        return jsonify({"success": True, "files": files})
+        return Response(stream_page(
+            "files", files, limit,
+            cursor_of=lambda file: [file["uploadedAt"].isoformat(), str(file["_id"])],
+            render=render_file,
+            dumps=current_app.json.dumps
+        ), mimetype="application/json")
 
+    except (CursorError, ValueError) as e:
+        return jsonify({"success": False, "error": f"พารามิเตอร์ไม่ถูกต้อง: {str(e)}"}), 400
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/files/delete", methods=["DELETE"])
+def render_file(file: dict) -> dict:
+    file["_id"] = str(file["_id"])
+    if "uploadedAt" in file:
+        file["uploadedAt"] = file["uploadedAt"].isoformat()
+    return file
+
+
+@api.route("/api/files/delete", methods=["DELETE"])
 def delete_file():
     try:
         file_id = request.args.get("file_id")
@@ -356,17 +751,29 @@ def delete_file():
         month = request.args.get("month")
 
         if file_id:
-            result = payslips_collection.delete_one({"_id": ObjectId(file_id)})
+            query = {"_id": ObjectId(file_id)}
         elif all([account, year, month]):
-            result = payslips_collection.delete_one({
+            query = {
                 "accountNumber": account,
                 "year": year,
                 "month": month
-            })
+            }
         else:
             return jsonify({"success": False, "error": "ต้องระบุ file_id หรือ account/year/month"}), 400
 
-        if result.deleted_count > 0:
+        # A slip claimed by a running month deletion is that deletion's to count
+        deleted = payslips_collection.find_one_and_delete(
+            {**query, **unclaimed(datetime.utcnow())},
+            projection={"accountNumber": 1, "year": 1, "month": 1, "pdfHash": 1}
+        )
+
+        if deleted:
+            slip_cache.invalidate(SlipCache.key(deleted["accountNumber"], deleted["year"], deleted["month"]))
+            ingest_cache.forget_month(deleted["year"], deleted["month"])
+            month_catalog.apply({(deleted["year"], deleted["month"]): -1})
+            slip_counters.remove_slips([deleted["accountNumber"]])
+            search_index.remove_slip(deleted["accountNumber"], deleted["year"], deleted["month"])
+            blob_store.release([deleted.get("pdfHash")], payslips_collection)
             return jsonify({"success": True, "message": "ลบไฟล์สำเร็จ"})
         else:
             return jsonify({"success": False, "error": "ไม่พบไฟล์"}), 404
@@ -375,7 +782,64 @@ def delete_file():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/files/count", methods=["GET"])
+# Slips fetched per cursor round trip while exporting
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 50))
+
+
+def iter_export_entries(cursor):
+    """(entry name, PDF file object) for each slip of an export cursor"""
+    for slip in cursor:
+        pdf_file = open_slip_pdf(slip)
+        if pdf_file is None:
+            continue
+        name = slip.get("fileName") or f"{slip['accountNumber']}_{slip['year']}_{slip['month']}.pdf"
+        yield name, pdf_file
+
+
+@api.route("/api/files/export", methods=["GET"])
+def export_month_slips():
+    """Stream a ZIP of every slip of a month, optionally only accounts starting with a prefix"""
+    try:
+        year = request.args.get("year")
+        month = request.args.get("month")
+        account_prefix = request.args.get("accountPrefix", "")
+        requester_email = request.args.get("requesterEmail")
+
+        if not all([year, month]):
+            return jsonify({"success": False, "error": "กรุณาระบุปีและเดือน"}), 400
+
+        if not admin_cache.is_admin(requester_email):
+            return jsonify({"success": False, "error": "ไม่มีสิทธิ์ส่งออกสลิป"}), 403
+
+        if account_prefix and not account_prefix.isdigit():
+            return jsonify({"success": False, "error": "เลขบัญชีต้องเป็นตัวเลข"}), 400
+
+        query = {"year": str(year), "month": str(month).zfill(2)}
+        if account_prefix:
+            query["accountNumber"] = {"$regex": "^" + re.escape(account_prefix)}
+
+        if not payslips_collection.find_one(query, {"_id": 1}):
+            return jsonify({"success": False, "error": "ไม่พบสลิปในเดือนและปีที่ระบุ"}), 404
+
+        # Entries are written as the cursor delivers slips, one batch of
+        # documents and one PDF at a time
+        cursor = payslips_collection.find(
+            query,
+            {"accountNumber": 1, "year": 1, "month": 1, "fileName": 1, "pdfHash": 1, "pdfData": 1}
+        ).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+
+        filename = f"slips_{query['year']}_{query['month']}"
+        if account_prefix:
+            filename += f"_{account_prefix}"
+        response = Response(iter_zip(iter_export_entries(cursor)), mimetype="application/zip")
+        response.headers.set("Content-Disposition", "attachment", filename=f"{filename}.zip")
+        return response
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api.route("/api/files/count", methods=["GET"])
 def count_slips():
     """Count slips for a specific month and year"""
     try:
@@ -406,12 +870,100 @@ def count_slips():
         }), 500
 
 
-@app.route("/api/files/delete-month", methods=["DELETE"])
+# Month deletion runs in _id-ordered batches; each batch waits for a majority
+# of replicas, then pauses, so secondaries keep up and reads aren't starved
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", 500))
+DELETE_BATCH_PAUSE_SECONDS = float(os.getenv("DELETE_BATCH_PAUSE_SECONDS", 0.1))
+
+# A batch claimed for deletion belongs to its deleter this long; a claim left
+# by a deleter that died expires and the slips can be deleted again
+DELETE_CLAIM_SECONDS = 300
+
+
+def unclaimed(now: datetime) -> dict:
+    """Filter for slips no running deletion has claimed"""
+    return {"$or": [{"deletingUntil": {"$exists": False}}, {"deletingUntil": {"$lt": now}}]}
+
+
+def delete_month(year: str, month: str, batch_size: int = None, progress: JobProgress = None) -> int:
+    """
+    Delete one month of slips batch by batch; returns the number deleted
+
+    Catalog, counters, search index, caches and blobs are updated after
+    every batch, so they stay consistent if the deletion stops part way.
+    Each batch is claimed before it is deleted, and derived data follows
+    only the slips this call claimed and removed: a concurrent delete of
+    the same month or slip never counts a slip twice, and slips written
+    after the read are left alone.
+    """
+    batch_size = batch_size or DELETE_BATCH_SIZE
+    month_query = {"year": year, "month": month}
+    majority_payslips = payslips_collection.with_options(write_concern=WriteConcern(w="majority"))
+
+    # Stop re-uploads of this month from being skipped as already ingested
+    ingest_cache.forget_month(year, month)
+    total = payslips_collection.count_documents(month_query)
+    if progress:
+        progress.update(slipsTotal=total, slipsDeleted=0)
+
+    deleted = 0
+    last_id = None
+    while True:
+        query = dict(month_query)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(payslips_collection.find(
+            query,
+            {"_id": 1, "accountNumber": 1, "pdfHash": 1}
+        ).sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        last_id = batch[-1]["_id"]
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        majority_payslips.update_many(
+            {"_id": {"$in": [slip_data["_id"] for slip_data in batch]}, **unclaimed(now)},
+            {"$set": {"deleteToken": token, "deletingUntil": now + timedelta(seconds=DELETE_CLAIM_SECONDS)}}
+        )
+        claimed = list(payslips_collection.find(
+            {"deleteToken": token},
+            {"_id": 1, "accountNumber": 1, "pdfHash": 1}
+        ))
+        result = majority_payslips.delete_many({"_id": {"$in": [slip_data["_id"] for slip_data in claimed]}})
+        accounts = [slip_data["accountNumber"] for slip_data in claimed]
+
+        slip_cache.invalidate_month(year, month)
+        month_catalog.apply({(year, month): -result.deleted_count})
+        slip_counters.remove_slips(accounts)
+        search_index.remove_month(year, month, accounts)
+        blob_store.release([slip_data.get("pdfHash") for slip_data in claimed], payslips_collection)
+
+        deleted += result.deleted_count
+        if progress:
+            progress.update(slipsDeleted=deleted)
+        if len(batch) < batch_size:
+            break
+        time.sleep(DELETE_BATCH_PAUSE_SECONDS)
+
+    return deleted
+
+
+def run_delete_month_job(year: str, month: str, batch_size: int = None):
+    """Job body for an asynchronous month deletion"""
+    def run(progress: JobProgress) -> dict:
+        deleted = delete_month(year, month, batch_size=batch_size, progress=progress)
+        return {"deletedCount": deleted, "year": year, "month": month}
+    return run
+
+
+@api.route("/api/files/delete-month", methods=["DELETE"])
 def delete_month_slips():
     """Delete all slips for a specific month and year"""
     try:
         year = request.args.get("year")
         month = request.args.get("month")
+        batch_size = request.args.get("batchSize", type=int)
 
         if not all([year, month]):
             return jsonify({
@@ -419,17 +971,35 @@ def delete_month_slips():
                 "error": "กรุณาระบุปีและเดือน"
             }), 400
 
-        # Delete all documents matching the year and month
-        result = payslips_collection.delete_many({
-            "year": str(year),
-            "month": str(month).zfill(2)
-        })
+        year = str(year)
+        month = str(month).zfill(2)
+
+        # Async mode: run the batches as a job and report progress there
+        if request.args.get("async", "").lower() in ("1", "true"):
+            if not payslips_collection.find_one({"year": year, "month": month}, {"_id": 1}):
+                return jsonify({
+                    "success": False,
+                    "error": "ไม่พบสลิปในเดือนและปีที่ระบุ"
+                }), 404
+
+            job_id = job_queue.submit(
+                "delete-month",
+                run_delete_month_job(year, month, batch_size),
+                {"year": year, "month": month}
+            )
+            return jsonify({
+                "success": True,
+                "jobId": job_id,
+                "statusUrl": f"{request.host_url}api/jobs/{job_id}"
+            }), 202
 
-        if result.deleted_count > 0:
+        deleted_count = delete_month(year, month, batch_size=batch_size)
+
+        if deleted_count > 0:
             return jsonify({
                 "success": True,
-                "message": f"ลบสลิปสำเร็จ {result.deleted_count} รายการ",
-                "deletedCount": result.deleted_count
+                "message": f"ลบสลิปสำเร็จ {deleted_count} รายการ",
+                "deletedCount": deleted_count
             })
         else:
             return jsonify({
@@ -444,48 +1014,70 @@ def delete_month_slips():
         }), 500
 
 
-@app.route("/api/search", methods=["POST"])
+@api.route("/api/search", methods=["POST"])
 def search_slips():
     try:
         data = request.get_json(force=True)
         search_term = data.get("search", "")
 
+        limit = parse_limit(data.get("limit"), 50)
+        cursor = data.get("cursor")
+
         if not search_term:
             return jsonify({"success": False, "error": "กรุณาระบุคำค้นหา"}), 400
 
-        query = {
-            "$or": [
-                {"name": {"$regex": search_term, "$options": "i"}},
-                {"accountNumber": {"$regex": search_term, "$options": "i"}}
-            ]
-        }
+        after = None
+        if cursor:
+            latest, account = decode_cursor(cursor, str, str)
+            after = after_filter(("latest", latest), ("_id", account))
+
+        # One result per soldier, newest month first; months lists every
+        # month that soldier has a slip for
+        # Built by migrate.py or /api/stats/reconcile, never inside a request
+        if not search_index.is_built():
+            return jsonify({"success": False, "error": "ดัชนีค้นหายังไม่พร้อม กรุณาลองใหม่ภายหลัง"}), 503
+
+        return Response(stream_page(
+            "results", open_page(search_index.search(search_term, after)), limit,
+            cursor_of=lambda soldier: [soldier["latest"], soldier["_id"]],
+            render=render_soldier,
+            dumps=current_app.json.dumps
+        ), mimetype="application/json")
+
+    except (CursorError, ValueError) as e:
+        return jsonify({"success": False, "error": f"พารามิเตอร์ไม่ถูกต้อง: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
 
-        results = list(payslips_collection.find(
-            query,
-            {"pdfData": 0}
-        ).sort("year", -1).limit(50))
 
-        for result in results:
-            result["_id"] = str(result["_id"])
-            if "uploadedAt" in result:
-                result["uploadedAt"] = result["uploadedAt"].isoformat()
+def render_soldier(soldier: dict) -> dict:
+    year, month = soldier["latest"].split("-")
+    return {
+        "accountNumber": soldier["_id"],
+        "name": soldier.get("name", ""),
+        "rank": soldier.get("rank", ""),
+        "year": year,
+        "month": month,
+        "months": [
+            {"year": period.split("-")[0], "month": period.split("-")[1]}
+            for period in sorted(soldier.get("months", []), reverse=True)
+        ]
+    }
 
-        return jsonify({"success": True, "results": results})
 
-    except Exception as e:
-        return jsonify({"success": False, "error": str(e)}), 500
+def load_statistics() -> dict:
+    stats = slip_counters.totals()
+    stats["months"] = month_catalog.months()
+    return stats
 
 
-@app.route("/api/stats", methods=["GET"])
+@api.route("/api/stats", methods=["GET"])
 def get_statistics():
     try:
-        total_slips = payslips_collection.count_documents({})
-        unique_accounts = len(payslips_collection.distinct("accountNumber"))
+        if not (slip_counters.is_built() and month_catalog.is_built()):
+            return jsonify({"success": False, "error": "สถิติยังไม่พร้อม กรุณาลองใหม่ภายหลัง"}), 503
 
-        stats = {
-            "totalSlips": total_slips,
-            "uniqueAccounts": unique_accounts
-        }
+        stats = single_flight.do("stats", load_statistics)
 
         return jsonify({"success": True, "stats": stats})
 
@@ -493,16 +1085,121 @@ def get_statistics():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/health", methods=["GET"])
+@api.route("/api/stats/reconcile", methods=["POST"])
+def reconcile_statistics():
+    """Recount stats counters, the month catalog and the search index from payslips in the background"""
+    try:
+        data = request.get_json(silent=True) or {}
+        requester_email = data.get("requesterEmail") or request.args.get("requesterEmail")
+
+        if not admin_cache.is_admin(requester_email):
+            return jsonify({"success": False, "error": "ไม่มีสิทธิ์คำนวณสถิติใหม่"}), 403
+
+        def run(progress: JobProgress) -> dict:
+            totals = slip_counters.reconcile()
+            months = month_catalog.rebuild()
+            soldiers = search_index.rebuild()
+            return {
+                "totalSlips": totals["totalSlips"],
+                "uniqueAccounts": totals["uniqueAccounts"],
+                "months": months,
+                "soldiers": soldiers
+            }
+
+        job_id = job_queue.submit("reconcile-stats", run)
+        return jsonify({
+            "success": True,
+            "jobId": job_id,
+            "statusUrl": f"{request.host_url}api/jobs/{job_id}"
+        }), 202
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api.route("/api/cache/stats", methods=["GET"])
+def get_cache_stats():
+    """Hit/miss counters of this worker's caches, for sizing SLIP_CACHE_BYTES and ADMIN_CACHE_TTL"""
+    return jsonify({
+        "success": True,
+        "pid": os.getpid(),
+        "slipCache": slip_cache.stats(),
+        "singleFlight": single_flight.stats(),
+        "adminCache": admin_cache.stats()
+    })
+
+
+@api.route("/api/line/link", methods=["POST"])
+def link_line_user():
+    """Remember which account a LINE user reads, so slip notices reach only them"""
+    try:
+        data = request.get_json(force=True)
+        line_user_id = data.get("lineUserId")
+        account = data.get("accountNumber")
+        replace = data.get("replace") is True
+
+        if not all([line_user_id, account]):
+            return jsonify({"success": False, "error": "กรุณาระบุข้อมูลให้ครบถ้วน"}), 400
+
+        if not payslips_collection.find_one({"accountNumber": account}, {"_id": 1}):
+            return jsonify({"success": False, "error": "ไม่พบเลขบัญชีนี้"}), 404
+
+        # Viewing someone else's slip must not move this user's notices;
+        # an existing link only changes when the user asks for it
+        if not line_users.link(line_user_id, account, replace=replace):
+            return jsonify({"success": False, "error": "บัญชี LINE นี้รับแจ้งเตือนของเลขบัญชีอื่นอยู่แล้ว"}), 409
+        return jsonify({"success": True})
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api.route("/api/line/link", methods=["DELETE"])
+def unlink_line_user():
+    try:
+        line_user_id = request.args.get("lineUserId")
+
+        if not line_user_id:
+            return jsonify({"success": False, "error": "กรุณาระบุข้อมูลให้ครบถ้วน"}), 400
+
+        if line_users.unlink(line_user_id):
+            return jsonify({"success": True})
+        return jsonify({"success": False, "error": "ไม่พบผู้ใช้นี้"}), 404
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api.route("/api/line/outbox", methods=["GET"])
+def get_line_outbox():
+    """Counts of queued, sent and failed LINE notifications, delivery stats and the latest ones"""
+    try:
+        recent = list(line_outbox.collection.find(
+            {},
+            {"messages": 0, "retryKey": 0, "to": 0}
+        ).sort("createdAt", -1).limit(20))
+
+        for item in recent:
+            for field in ("createdAt", "sentAt", "nextAttemptAt", "leaseUntil"):
+                if item.get(field):
+                    item[field] = item[field].isoformat()
+
+        return jsonify({"success": True, "counts": line_outbox.stats(), "recent": recent})
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+
+@api.route("/api/health", methods=["GET"])
 def health_check():
     try:
-        client.admin.command("ping")
+        db.client.admin.command("ping")
         return jsonify({"status": "healthy", "message": "API and database are running"})
     except Exception:
         return jsonify({"status": "unhealthy", "message": "Database connection failed"}), 500
     
 
-@app.route("/api/get-download-url", methods=["POST"])
+@api.route("/api/get-download-url", methods=["POST"])
 def get_download_url():
     """Generate a download URL for the PDF"""
     try:
@@ -526,7 +1223,7 @@ def get_download_url():
         return jsonify({"success": False, "error": str(e)}), 500
 
 
-@app.route("/api/download-pdf", methods=["GET"])
+@api.route("/api/download-pdf", methods=["GET"])
 def download_pdf():
     """Serve the PDF file for download"""
     try:
@@ -537,32 +1234,69 @@ def download_pdf():
         if not all([account, year, month]):
             return jsonify({"success": False, "error": "กรุณาระบุข้อมูลให้ครบถ้วน"}), 400
 
-        slip = payslips_collection.find_one({
-            "accountNumber": account,
-            "year": str(year),
-            "month": str(month).zfill(2)
-        })
+        slip = find_slip(account, year, month)
 
-        if not slip or "pdfData" not in slip:
+        if not slip or not has_pdf(slip):
             return jsonify({"success": False, "error": "ไม่พบสลิปเงินเดือน"}), 404
 
-        # Create a file-like object from the PDF data
-        pdf_io = io.BytesIO(slip["pdfData"])
-        
         # Generate filename
         filename = f"slip_{account}_{month}_{year}.pdf"
 
-        return send_file(
-            pdf_io,
-            mimetype='application/pdf',
-            as_attachment=True,
-            download_name=filename
-        )
+        return slip_pdf_response(slip, filename)
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+def create_app() -> Flask:
+    """
+    Build the Flask app
+
+    Cheap and free of side effects: no database round trips, index builds,
+    threads or PyMuPDF import. Serving processes call start_worker() once
+    they are ready to serve; indexes come from migrate.py.
+    """
+    app = Flask(__name__)
+    app.after_request(after_request)
+    app.register_blueprint(api)
+    return app
+
+
+def start_worker():
+    """
+    Background work of a serving process: optional migration, admin-cache
+    sync, job recovery and the LINE outbox sender
+
+    Called from the serving entry points only (gunicorn.conf.py, the ASGI
+    lifespan and `python app.py`), never at import, so migrate.py, the
+    benchmarks and the PDF pool's spawned children stay passive.
+    """
+    if os.getenv("MIGRATE_ON_STARTUP") == "1":
+        ensure_indexes()
+    admin_cache.start_sync()
+    # Fails jobs and removes upload files left behind by workers that died mid-job
+    job_queue.start(upload_dir=UPLOAD_DIR)
+    if os.getenv("LINE_OUTBOX_SENDER", "1") == "1":
+        line_outbox.start()
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `app` is built on first use (gunicorn app:app, asgi.py) rather than at
+    # import, so modules that only need ensure_indexes or the services
+    # don't build it
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
+    ensure_indexes()
+    start_worker()
     port = int(os.environ.get("PORT", 8000))
-    app.run(host="0.0.0.0", port=port, debug=False)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,240 @@
+"""
+ASGI serving mode
+
+Usage: uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 2
+
+Slip reads, the payday hot path, are async handlers on PyMongo's asyncio
+driver: a request waiting on MongoDB holds a coroutine rather than a
+thread, so one process can keep thousands of slip downloads in flight.
+Every other /api route is the Flask app from app.py, mounted through a2wsgi
+on its own thread pool, so uploads (PDF splitting already runs in a process
+pool), admin and file management behave exactly as under gunicorn.
+
+Both halves share app.py's per-process slip cache, so deletes and uploads
+handled by Flask invalidate what the async handlers serve.
+"""
+import base64
+import os
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from gridfs import AsyncGridFSBucket
+from pymongo import AsyncMongoClient
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, parse_range_header, quote_etag
+
+import app as flask_backend
+from mongo import MONGO_MAX_IDLE_TIME_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS
+from single_flight import AsyncSingleFlight
+from slip_blob_store import SlipBlobStore
+from slip_cache import SlipCache
+
+# Connections for the async handlers; sockets are cheap next to threads,
+# so this can be much larger than the WSGI pool's MONGO_MAX_POOL_SIZE
+ASYNC_MONGO_MAX_POOL_SIZE = int(os.getenv("ASYNC_MONGO_MAX_POOL_SIZE", 200))
+
+# Threads serving the mounted Flask routes
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 16))
+
+mongo = {}
+single_flight = AsyncSingleFlight()
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    # The async client belongs to the event loop, so it is built here rather
+    # than at import
+    client = AsyncMongoClient(
+        flask_backend.MONGO_URI,
+        maxPoolSize=ASYNC_MONGO_MAX_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS
+    )
+    db = client[flask_backend.DB_NAME]
+    mongo.update(client=client, payslips=db["payslips"], blobs=AsyncGridFSBucket(db, bucket_name="slip_blobs"))
+    flask_backend.start_worker()
+    try:
+        yield
+    finally:
+        mongo.clear()
+        await client.close()
+
+
+def json_response(request: Request, content: dict, status_code: int = 200) -> JSONResponse:
+    return JSONResponse(content, status_code=status_code, headers=flask_backend.cors_headers(request.headers.get("origin")))
+
+
+def preflight(request: Request) -> Response:
+    return Response(status_code=200, headers=flask_backend.cors_headers(request.headers.get("origin")))
+
+
+async def find_slip(account: str, year: str, month: str):
+    """Async twin of app.find_slip: cached slip with pdfData, else the payslip document alone"""
+    key = SlipCache.key(account, year, month)
+    slip = flask_backend.slip_cache.get(key)
+    if slip:
+        return slip
+
+    return await single_flight.do(("slip",) + key, lambda: load_slip(key))
+
+
+async def load_slip(key):
+    slip = await mongo["payslips"].find_one({
+        "accountNumber": key[0],
+        "year": key[1],
+        "month": key[2]
+    })
+    # Documents not yet moved to the blob store already hold their bytes
+    if slip and "pdfData" in slip:
+        flask_backend.slip_cache.put(key, slip)
+    return slip
+
+
+async def slip_pdf(slip) -> bytes:
+    """Async twin of app.slip_pdf: blob read only when the bytes are sent, then cached"""
+    if "pdfData" in slip:
+        return slip["pdfData"]
+
+    key = SlipCache.key(slip["accountNumber"], slip["year"], slip["month"])
+
+    async def load() -> bytes:
+        stream = await mongo["blobs"].open_download_stream(slip["pdfHash"])
+        pdf_bytes = await stream.read()
+        flask_backend.slip_cache.put(key, dict(slip, pdfData=pdf_bytes))
+        return pdf_bytes
+
+    return await single_flight.do(("pdf",) + key, load)
+
+
+async def slip_pdf_response(request: Request, slip, filename: str, as_attachment: bool = True) -> Response:
+    """Same contract as app.slip_pdf_response: strong ETag, 304 before any blob read, single byte ranges"""
+    etag = slip.get("pdfHash") or SlipBlobStore.content_hash(slip["pdfData"])
+
+    headers = flask_backend.cors_headers(request.headers.get("origin"))
+    headers["ETag"] = quote_etag(etag)
+    headers["Cache-Control"] = "private, no-cache"
+
+    if parse_etags(request.headers.get("if-none-match")).contains(etag):
+        return Response(status_code=304, headers=headers)
+
+    pdf_bytes = await slip_pdf(slip)
+    size = len(pdf_bytes)
+
+    headers["Accept-Ranges"] = "bytes"
+    headers["Content-Disposition"] = f"{'attachment' if as_attachment else 'inline'}; filename={filename}"
+
+    byte_range = parse_range_header(request.headers.get("range"))
+    if_range = request.headers.get("if-range")
+    if byte_range and (not if_range or if_range == headers["ETag"]):
+        span = byte_range.range_for_length(size)
+        if span is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        start, stop = span
+        headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        return Response(pdf_bytes[start:stop], status_code=206, media_type="application/pdf", headers=headers)
+
+    return Response(pdf_bytes, media_type="application/pdf", headers=headers)
+
+
+async def get_slip(request: Request) -> Response:
+    if request.method == "OPTIONS":
+        return preflight(request)
+    try:
+        data = await request.json()
+        account = data.get("account")
+        year = data.get("year")
+        month = data.get("month")
+
+        if not all([account, year, month]):
+            return json_response(request, {"success": False, "error": "กรุณาระบุข้อมูลให้ครบถ้วน"}, 400)
+
+        slip = await find_slip(account, year, month)
+
+        if not slip:
+            return json_response(request, {"success": False, "error": "ไม่พบสลิปเงินเดือน"}, 404)
+
+        accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+        wants_pdf = (
+            data.get("format") == "pdf" or
+            request.query_params.get("format") == "pdf" or
+            accept.best_match(["application/json", "application/pdf"]) == "application/pdf"
+        )
+        if wants_pdf and flask_backend.has_pdf(slip):
+            filename = f"slip_{account}_{month}_{year}.pdf"
+            response = await slip_pdf_response(request, slip, filename, as_attachment=False)
+            response.headers.update(flask_backend.slip_metadata_headers(slip))
+            return response
+
+        if flask_backend.has_pdf(slip):
+            return json_response(request, {
+                "success": True,
+                "pdfBase64": base64.b64encode(await slip_pdf(slip)).decode("utf-8"),
+                "metadata": {
+                    "name": slip.get("name", ""),
+                    "rank": slip.get("rank", ""),
+                    "accountNumber": slip.get("accountNumber", ""),
+                    "year": slip.get("year", ""),
+                    "month": slip.get("month", "")
+                }
+            })
+
+        return json_response(request, {"success": False, "error": "ไม่พบข้อมูล PDF"}, 404)
+
+    except Exception as e:
+        return json_response(request, {"success": False, "error": f"เกิดข้อผิดพลาด: {str(e)}"}, 500)
+
+
+async def download_pdf(request: Request) -> Response:
+    if request.method == "OPTIONS":
+        return preflight(request)
+    try:
+        account = request.query_params.get("account")
+        year = request.query_params.get("year")
+        month = request.query_params.get("month")
+
+        if not all([account, year, month]):
+            return json_response(request, {"success": False, "error": "กรุณาระบุข้อมูลให้ครบถ้วน"}, 400)
+
+        slip = await find_slip(account, year, month)
+
+        if not slip or not flask_backend.has_pdf(slip):
+            return json_response(request, {"success": False, "error": "ไม่พบสลิปเงินเดือน"}, 404)
+
+        return await slip_pdf_response(request, slip, f"slip_{account}_{month}_{year}.pdf")
+
+    except Exception as e:
+        return json_response(request, {"success": False, "error": str(e)}, 500)
+
+
+async def health_check(request: Request) -> Response:
+    try:
+        await mongo["client"].admin.command("ping")
+        return json_response(request, {"status": "healthy", "message": "API and database are running"})
+    except Exception:
+        return json_response(request, {"status": "unhealthy", "message": "Database connection failed"}, 500)
+
+
+async def async_cache_stats(request: Request) -> Response:
+    return json_response(request, {
+        "success": True,
+        "pid": os.getpid(),
+        "slipCache": flask_backend.slip_cache.stats(),
+        "singleFlight": single_flight.stats()
+    })
+
+
+app = Starlette(
+    routes=[
+        Route("/api/get-slip", get_slip, methods=["POST", "OPTIONS"]),
+        Route("/api/download-pdf", download_pdf, methods=["GET", "OPTIONS"]),
+        Route("/api/health", health_check, methods=["GET"]),
+        Route("/api/cache/async-stats", async_cache_stats, methods=["GET"]),
+        Mount("/", app=WSGIMiddleware(flask_backend.app, workers=WSGI_THREADS))
+    ],
+    lifespan=lifespan
+)
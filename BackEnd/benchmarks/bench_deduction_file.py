@@ -0,0 +1,70 @@
+"""
+Time parsing loan.txt and building its deductions documents
+
+Usage: python benchmarks/bench_deduction_file.py [loan.txt] [--people N]
+Defaults to resource/loan.txt. --people repeats the sample with fresh
+citizen ids until the file holds about N people.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from deduction_file import DEDUCTION_FILE_ENCODING, parse_deduction_file
+
+
+def scale(data: bytes, people: int) -> bytes:
+    """The sample repeated with each copy's ids offset, so every person is distinct"""
+    lines = data.decode(DEDUCTION_FILE_ENCODING).splitlines()
+    sample_people = len({line.split(",", 1)[0] for line in lines if line.strip()})
+    copies = max(1, -(-people // sample_people))
+    scaled = []
+    for copy in range(copies):
+        for line in lines:
+            if line.strip():
+                citizen_id, rest = line.split(",", 1)
+                scaled.append(f"{int(citizen_id) + copy * 10 ** 8:013d},{rest}")
+    return "\n".join(scaled).encode(DEDUCTION_FILE_ENCODING)
+
+
+def measure(data: bytes, runs: int) -> tuple:
+    """Returns (table, median parse seconds, median document seconds)"""
+    parse_times, document_times = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        table = parse_deduction_file(data)
+        parse_times.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in table.documents("2568", "05"):
+            pass
+        document_times.append(time.perf_counter() - started)
+    return table, statistics.median(parse_times), statistics.median(document_times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", nargs="?", default=os.path.join(BACKEND_DIR, "resource", "loan.txt"))
+    parser.add_argument("--people", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.path, "rb") as f:
+        data = f.read()
+    if args.people:
+        data = scale(data, args.people)
+
+    table, parse_seconds, document_seconds = measure(data, args.runs)
+    print(
+        f"{len(data):,} bytes, {len(table):,} people, {len(table.codes)} codes: "
+        f"parse {parse_seconds * 1000:.1f} ms, documents {document_seconds * 1000:.1f} ms "
+        f"(median of {args.runs}); columns {table.amounts.nbytes:,} bytes"
+    )
+
+
+if __name__ == "__main__":
+    main()
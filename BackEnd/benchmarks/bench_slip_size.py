@@ -0,0 +1,54 @@
+"""
+Bytes per slip with and without compact output
+
+Usage: python benchmarks/bench_slip_size.py [pdf ...]
+Defaults to every PDF in resource/.
+"""
+import glob
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from pdf_processor import PDFProcessor
+
+
+def measure(pdf_content: bytes, compact: bool) -> tuple:
+    """Returns (slip count, total bytes, seconds)"""
+    processor = PDFProcessor(compact=compact)
+    started = time.perf_counter()
+    count, total = 0, 0
+    for slip in processor.iter_slips(pdf_content, workers=1):
+        count += 1
+        total += len(slip["pdfData"])
+    return count, total, time.perf_counter() - started
+
+
+def main(paths):
+    print(f"{'file':<32} {'slips':>6} {'plain B/slip':>13} {'compact B/slip':>15} {'saved':>7} {'plain s':>8} {'compact s':>10}")
+    for path in paths:
+        with open(path, "rb") as f:
+            pdf_content = f.read()
+
+        try:
+            count, plain_bytes, plain_time = measure(pdf_content, compact=False)
+        except ValueError as e:
+            print(f"{os.path.basename(path):<32} skipped: {e}")
+            continue
+        _, compact_bytes, compact_time = measure(pdf_content, compact=True)
+
+        if not count:
+            print(f"{os.path.basename(path):<32} no slips found")
+            continue
+
+        saved = 1 - compact_bytes / plain_bytes
+        print(
+            f"{os.path.basename(path):<32} {count:>6} {plain_bytes // count:>13,} "
+            f"{compact_bytes // count:>15,} {saved:>7.1%} {plain_time:>8.2f} {compact_time:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob(os.path.join(BACKEND_DIR, "resource", "*.pdf"))))
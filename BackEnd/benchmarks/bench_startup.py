@@ -0,0 +1,48 @@
+"""
+Worker startup time: importing app.py and building the Flask app in a fresh interpreter
+
+Usage: python benchmarks/bench_startup.py [runs]
+Uses MONGO_URI from the environment or .env; the app should not need to
+reach it at import, so an unreachable URI is a fair test.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import sys, threading, time
+started = time.perf_counter()
+import app
+app.app
+elapsed = time.perf_counter() - started
+print(elapsed, "fitz" in sys.modules, app.db.connected, threading.active_count() == 1)
+"""
+
+
+def measure() -> tuple:
+    """Returns (seconds, fitz imported, mongo client created, no threads started) for one cold import"""
+    env = dict(os.environ)
+    env.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout.split()[-4:]
+    return float(output[0]), output[1] == "True", output[2] == "True", output[3] == "True"
+
+
+def main(runs: int):
+    results = [measure() for _ in range(runs)]
+    times = [result[0] for result in results]
+    print(f"runs: {runs}")
+    print(f"import app: median {statistics.median(times) * 1000:.0f} ms, "
+          f"min {min(times) * 1000:.0f} ms, max {max(times) * 1000:.0f} ms")
+    print(f"PyMuPDF imported at startup: {results[0][1]}")
+    print(f"MongoClient created at startup: {results[0][2]}")
+    print(f"Background threads started at startup: {not results[0][3]}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
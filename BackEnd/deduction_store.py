@@ -0,0 +1,48 @@
+import os
+from datetime import datetime
+from typing import Any, Dict
+
+from pymongo import UpdateOne
+
+from slip_ingestor import batched
+
+# Deduction documents written to MongoDB per bulk_write
+DEDUCTION_BATCH_SIZE = int(os.getenv("DEDUCTION_BATCH_SIZE", 1000))
+
+
+class DeductionStore:
+    """
+    Monthly loan and welfare deductions per person
+
+    {citizenId, year, month, name, deductions: {code: baht}, total, uploadedAt},
+    unique on (citizenId, year, month). Loading a month's file again
+    replaces each person's deductions for that month.
+    """
+
+    def __init__(self, collection, batch_size: int = None):
+        self.collection = collection
+        self.batch_size = batch_size or DEDUCTION_BATCH_SIZE
+
+    def ensure_indexes(self):
+        self.collection.create_index([("citizenId", 1), ("year", 1), ("month", 1)], unique=True)
+        self.collection.create_index([("year", 1), ("month", 1)])
+
+    def load(self, table, year: str, month: str) -> Dict[str, Any]:
+        """Upsert a DeductionTable as the given month; returns inserted/updated/total counts"""
+        result = {"inserted": 0, "updated": 0, "total": 0, "codes": [str(code) for code in table.codes.tolist()]}
+        uploaded_at = datetime.utcnow()
+
+        for batch in batched(table.documents(year, month), self.batch_size):
+            written = self.collection.bulk_write([
+                UpdateOne(
+                    {"citizenId": doc["citizenId"], "year": year, "month": month},
+                    {"$set": dict(doc, uploadedAt=uploaded_at)},
+                    upsert=True
+                )
+                for doc in batch
+            ], ordered=False)
+            result["inserted"] += written.upserted_count
+            result["updated"] += len(batch) - written.upserted_count
+            result["total"] += len(batch)
+
+        return result
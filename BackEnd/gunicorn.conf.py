@@ -0,0 +1,10 @@
+"""
+gunicorn settings: `gunicorn app:app` picks this file up from the working directory
+"""
+
+
+def post_worker_init(worker):
+    # Each worker runs its own LINE outbox sender and admin-cache sync;
+    # the master and `python migrate.py` never do
+    import app
+    app.start_worker()
@@ -0,0 +1,59 @@
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class IngestCache:
+    """
+    Record of PDF documents already ingested, keyed by SHA-256 of the bytes
+
+    Lets an identical re-upload be answered without splitting the PDF again.
+    A month keeps only the record of its latest ingest, and records for a
+    month are dropped whenever slips of that month are deleted, so only a
+    re-upload of what the month currently holds is skipped.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([("year", 1), ("month", 1)])
+
+    @staticmethod
+    def hash_stream(stream) -> str:
+        """SHA-256 hex digest of a file-like object, rewound afterwards"""
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        stream.seek(0)
+        return digest.hexdigest()
+
+    def lookup(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        return self.collection.find_one({"_id": content_hash})
+
+    def record(self, content_hash: str, result: Dict[str, Any], file_name: str = None):
+        """Remember a successfully ingested document as its month's latest"""
+        # Earlier documents of the month no longer match what is stored;
+        # re-uploading one of them (a revert) must be processed again
+        self.collection.delete_many({
+            "year": result["year"],
+            "month": result["month"],
+            "_id": {"$ne": content_hash}
+        })
+        self.collection.replace_one(
+            {"_id": content_hash},
+            {
+                "_id": content_hash,
+                "year": result["year"],
+                "month": result["month"],
+                "slipCount": result["total"],
+                "fileName": file_name,
+                "ingestedAt": datetime.utcnow()
+            },
+            upsert=True
+        )
+
+    def forget_month(self, year: str, month: str):
+        self.collection.delete_many({"year": year, "month": month})
@@ -0,0 +1,224 @@
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+# Background jobs run per gunicorn worker; keep the pool small so uploads
+# don't starve request threads
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+
+# Finished job documents are removed by a TTL index after this many seconds
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+
+# The owning process renews its unfinished jobs' lease every quarter of this;
+# a job whose lease ran out belongs to a process that is gone
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 120))
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+
+class JobProgress:
+    """Progress handle passed to a running job; writes are throttled"""
+
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, collection, job_id: str):
+        self.collection = collection
+        self.job_id = job_id
+        self.progress: Dict[str, Any] = {}
+        self._last_flush = 0.0
+
+    def update(self, **fields):
+        """Merge progress fields, flushing to MongoDB at most once per second"""
+        self.progress.update(fields)
+        if time.monotonic() - self._last_flush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        self.collection.update_one(
+            {"_id": self.job_id},
+            {"$set": {f"progress.{key}": value for key, value in self.progress.items()}}
+        )
+
+
+class JobQueue:
+    """
+    Local background job runner backed by a thread pool
+
+    Job state lives in MongoDB so any worker can answer a status request,
+    but the work itself runs in the process that accepted it. That process
+    (owner: {host, pid, instance}) keeps a lease on its unfinished jobs; when it dies
+    the lease runs out and the job is marked failed, and the files it was
+    given are removed.
+    """
+
+    def __init__(self, collection, max_workers: int = None):
+        self.collection = collection
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or JOB_WORKERS,
+            thread_name_prefix="job"
+        )
+        self._heartbeat_started = False
+        self._lock = threading.Lock()
+        self._instance = None
+
+    def owner(self) -> Dict[str, Any]:
+        # host and pid repeat after a container restart; the random instance
+        # id keeps a new process from renewing a dead one's jobs. Made per
+        # pid so a forked child never inherits its parent's
+        with self._lock:
+            if self._instance is None or self._instance[0] != os.getpid():
+                self._instance = (os.getpid(), uuid.uuid4().hex)
+        return {"host": socket.gethostname(), "pid": os.getpid(), "instance": self._instance[1]}
+
+    def ensure_indexes(self):
+        self.collection.create_index("finishedAt", expireAfterSeconds=JOB_RETENTION_SECONDS)
+        self.collection.create_index([("status", 1), ("leaseUntil", 1)])
+
+    def submit(self, kind: str, fn: Callable[[JobProgress], Dict[str, Any]],
+               params: Optional[Dict[str, Any]] = None, files: Optional[List[str]] = None) -> str:
+        """Queue fn(progress) and return the new job id; files are removed if the job is abandoned"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        self.collection.insert_one({
+            "_id": job_id,
+            "kind": kind,
+            "status": "queued",
+            "params": params or {},
+            "files": files or [],
+            "owner": self.owner(),
+            "leaseUntil": now + timedelta(seconds=JOB_LEASE_SECONDS),
+            "progress": {},
+            "errors": [],
+            "createdAt": now
+        })
+        self.executor.submit(self._run, job_id, fn)
+        return job_id
+
+    def start(self, upload_dir: str = None):
+        """
+        Start this process's heartbeat thread
+
+        It renews this process's leases and fails jobs abandoned by others;
+        on its first round it also sweeps orphaned files out of upload_dir.
+        """
+        with self._lock:
+            if self._heartbeat_started:
+                return
+            self._heartbeat_started = True
+        threading.Thread(target=self._heartbeat, args=(upload_dir,), name="job-heartbeat", daemon=True).start()
+
+    def _heartbeat(self, upload_dir: Optional[str]):
+        while True:
+            try:
+                self.renew()
+                self.recover()
+                if upload_dir:
+                    removed = self.sweep_files(upload_dir)
+                    if removed:
+                        print(f"🧹 Removed {removed} orphaned upload file(s)")
+                    upload_dir = None
+            except Exception as e:
+                # Never let the thread die: other workers would then fail this one's live jobs
+                print(f"⚠️ Job heartbeat failed: {e}")
+            time.sleep(JOB_LEASE_SECONDS / 4)
+
+    def renew(self):
+        self.collection.update_many(
+            {"owner": self.owner(), "status": {"$in": ACTIVE_STATUSES}},
+            {"$set": {"leaseUntil": datetime.utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)}}
+        )
+
+    def recover(self) -> int:
+        """Mark queued/running jobs whose owner stopped renewing as failed; returns how many"""
+        recovered = 0
+        while True:
+            now = datetime.utcnow()
+            job = self.collection.find_one_and_update(
+                {"status": {"$in": ACTIVE_STATUSES}, "$or": [
+                    {"leaseUntil": {"$lt": now}},
+                    # Jobs queued before leases existed; no worker renews them
+                    {"leaseUntil": {"$exists": False}}
+                ]},
+                {
+                    "$set": {"status": "failed", "finishedAt": now},
+                    "$push": {"errors": "worker stopped before the job finished"}
+                },
+                projection={"files": 1, "owner": 1}
+            )
+            if not job:
+                return recovered
+            recovered += 1
+            self.remove_files(job.get("files", []))
+            print(f"⚠️ Job {job['_id']} abandoned by {job.get('owner')}, marked failed")
+
+    @staticmethod
+    def remove_files(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def sweep_files(self, directory: str) -> int:
+        """
+        Remove files in directory that no unfinished job holds; returns how many
+
+        Files younger than a lease are kept, since a job may be about to be
+        submitted for them.
+        """
+        if not os.path.isdir(directory):
+            return 0
+        held = set()
+        for job in self.collection.find({"status": {"$in": ACTIVE_STATUSES}}, {"files": 1}):
+            held.update(os.path.abspath(path) for path in job.get("files", []))
+
+        cutoff = time.time() - JOB_LEASE_SECONDS
+        removed = 0
+        for name in os.listdir(directory):
+            path = os.path.abspath(os.path.join(directory, name))
+            try:
+                if path in held or not os.path.isfile(path) or os.path.getmtime(path) > cutoff:
+                    continue
+                self.remove_files([path])
+            except OSError:
+                # Removed meanwhile by the job that held it, or unreadable
+                continue
+            removed += 1
+        return removed
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status for clients; server paths and lease bookkeeping left out"""
+        return self.collection.find_one({"_id": job_id}, {"files": 0, "owner": 0, "leaseUntil": 0})
+
+    def _run(self, job_id: str, fn: Callable[[JobProgress], Dict[str, Any]]):
+        progress = JobProgress(self.collection, job_id)
+        self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "running", "startedAt": datetime.utcnow()}}
+        )
+
+        try:
+            result = fn(progress)
+            progress.flush()
+            self.collection.update_one(
+                {"_id": job_id},
+                {"$set": {"status": "done", "result": result, "finishedAt": datetime.utcnow()}}
+            )
+        except Exception as e:
+            traceback.print_exc()
+            progress.flush()
+            self.collection.update_one(
+                {"_id": job_id},
+                {
+                    "$set": {"status": "failed", "finishedAt": datetime.utcnow()},
+                    "$push": {"errors": str(e)}
+                }
+            )
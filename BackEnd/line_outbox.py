@@ -0,0 +1,219 @@
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+# Retry schedule: LINE_RETRY_BASE_SECONDS * 2^attempt, capped, with jitter
+LINE_MAX_ATTEMPTS = int(os.getenv("LINE_MAX_ATTEMPTS", 8))
+LINE_RETRY_BASE_SECONDS = float(os.getenv("LINE_RETRY_BASE_SECONDS", 5))
+LINE_RETRY_MAX_SECONDS = float(os.getenv("LINE_RETRY_MAX_SECONDS", 1800))
+
+# A claimed message is handed to another sender if not finished in this time
+LINE_SEND_LEASE_SECONDS = int(os.getenv("LINE_SEND_LEASE_SECONDS", 60))
+
+# How often an idle sender looks for due messages queued by other workers
+LINE_OUTBOX_POLL_SECONDS = float(os.getenv("LINE_OUTBOX_POLL_SECONDS", 5))
+
+# Sender threads per worker, and LINE API requests per second per worker
+LINE_SEND_CONCURRENCY = int(os.getenv("LINE_SEND_CONCURRENCY", 4))
+LINE_RATE_PER_SECOND = float(os.getenv("LINE_RATE_PER_SECOND", 20))
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds before the next try after `attempts` failed ones"""
+    delay = min(LINE_RETRY_BASE_SECONDS * (2 ** (attempts - 1)), LINE_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+class RateLimiter:
+    """Token bucket shared by the sender threads of one process"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class LineOutbox:
+    """
+    Durable queue of LINE broadcasts and multicasts, delivered in the background
+
+    Callers enqueue() and return at once; LINE_SEND_CONCURRENCY daemon
+    threads in each worker claim due messages with a lease and send them,
+    at most LINE_RATE_PER_SECOND requests per second. The dedup key is the
+    document _id, so the same notice is queued only once however many times
+    it is produced. Each message keeps one retry key for all of its
+    attempts, so LINE drops a resend of a request it already accepted.
+    Every attempt is recorded in the deliveries collection.
+
+    {_id: dedupKey, kind: broadcast|multicast, messages, to, recipients, retryKey,
+     status: pending|sending|sent|failed, attempts, nextAttemptAt, leaseUntil,
+     lastError, createdAt, sentAt}
+    """
+
+    def __init__(self, collection, send: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 deliveries_collection=None, concurrency: int = None, rate_per_second: float = None):
+        self.collection = collection
+        self.deliveries = deliveries_collection
+        self.send = send
+        self.concurrency = LINE_SEND_CONCURRENCY if concurrency is None else concurrency
+        self.rate_limiter = RateLimiter(LINE_RATE_PER_SECOND if rate_per_second is None else rate_per_second)
+        self._wake = threading.Condition()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def ensure_indexes(self):
+        self.collection.create_index([("status", 1), ("nextAttemptAt", 1)])
+        if self.deliveries is not None:
+            self.deliveries.create_index([("outboxId", 1)])
+            self.deliveries.create_index([("at", -1)])
+
+    def enqueue(self, dedup_key: str, kind: str, messages: List[Dict[str, Any]],
+                to: Optional[List[str]] = None) -> bool:
+        """Queue messages (for the users in `to` when multicasting); False when the dedup key was queued before"""
+        now = datetime.utcnow()
+        try:
+            self.collection.insert_one({
+                "_id": dedup_key,
+                "kind": kind,
+                "messages": messages,
+                "to": to,
+                "recipients": len(to) if to is not None else None,
+                "retryKey": str(uuid.uuid4()),
+                "status": "pending",
+                "attempts": 0,
+                "nextAttemptAt": now,
+                "createdAt": now
+            })
+        except DuplicateKeyError:
+            return False
+        with self._wake:
+            self._wake.notify_all()
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.concurrency):
+            threading.Thread(target=self._run, name=f"line-outbox-{i}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                while self.deliver_next():
+                    pass
+            except PyMongoError as e:
+                print(f"⚠️ LINE outbox unavailable: {e}")
+            with self._wake:
+                self._wake.wait(LINE_OUTBOX_POLL_SECONDS)
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "nextAttemptAt": {"$lte": now}},
+                # Sender died mid-send; the retry key makes resending safe
+                {"status": "sending", "leaseUntil": {"$lt": now}}
+            ]},
+            {"$set": {"status": "sending", "leaseUntil": now + timedelta(seconds=LINE_SEND_LEASE_SECONDS)}},
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def deliver_next(self) -> bool:
+        """Send one due message; False when none is due"""
+        message = self.claim()
+        if not message:
+            return False
+
+        self.rate_limiter.acquire()
+        started = time.monotonic()
+        result = self.send(message)
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+        attempts = message["attempts"] + 1
+        now = datetime.utcnow()
+        self._record(message, attempts, result, elapsed_ms, now)
+
+        if result.get("success"):
+            update = {"status": "sent", "sentAt": now, "attempts": attempts}
+            print(f"✅ LINE {message['kind']} sent: {message['_id']}")
+        elif result.get("retryable") and attempts < LINE_MAX_ATTEMPTS:
+            delay = retry_delay(attempts)
+            update = {
+                "status": "pending",
+                "attempts": attempts,
+                "nextAttemptAt": now + timedelta(seconds=delay),
+                "lastError": result.get("error")
+            }
+            print(f"⚠️ LINE {message['kind']} failed ({result.get('error')}), retry in {delay:.0f}s: {message['_id']}")
+        else:
+            update = {"status": "failed", "attempts": attempts, "lastError": result.get("error")}
+            print(f"❌ LINE {message['kind']} gave up after {attempts} attempts: {message['_id']}")
+
+        self.collection.update_one(
+            {"_id": message["_id"], "status": "sending"},
+            {"$set": update, "$unset": {"leaseUntil": ""}}
+        )
+        return True
+
+    def _record(self, message: Dict[str, Any], attempt: int, result: Dict[str, Any],
+                elapsed_ms: int, at: datetime):
+        if self.deliveries is None:
+            return
+        try:
+            self.deliveries.insert_one({
+                "outboxId": message["_id"],
+                "kind": message["kind"],
+                "recipients": message.get("recipients"),
+                "attempt": attempt,
+                "success": bool(result.get("success")),
+                "status": result.get("status"),
+                "error": result.get("error"),
+                "elapsedMs": elapsed_ms,
+                "at": at
+            })
+        except PyMongoError as e:
+            print(f"⚠️ Failed to record LINE delivery: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        counts = {"pending": 0, "sending": 0, "sent": 0, "failed": 0}
+        for item in self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]):
+            counts[item["_id"]] = item["count"]
+        if self.deliveries is None:
+            return counts
+
+        deliveries = {}
+        for item in self.deliveries.aggregate([{"$group": {
+            "_id": "$kind",
+            "attempts": {"$sum": 1},
+            "succeeded": {"$sum": {"$cond": ["$success", 1, 0]}},
+            "recipientsDelivered": {"$sum": {"$cond": ["$success", {"$ifNull": ["$recipients", 0]}, 0]}},
+            "avgElapsedMs": {"$avg": "$elapsedMs"}
+        }}]):
+            kind = item.pop("_id")
+            item["avgElapsedMs"] = round(item["avgElapsedMs"] or 0)
+            deliveries[kind] = item
+        counts["deliveries"] = deliveries
+        return counts
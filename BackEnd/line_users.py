@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+# Accounts per $in query when resolving recipients
+LOOKUP_CHUNK_SIZE = 1000
+
+
+class LineUsers:
+    """
+    Which LINE user reads which account's slips
+
+    {_id: lineUserId, accountNumber, linkedAt}. A LINE user follows one
+    account, kept until it is explicitly replaced or unlinked; an account
+    can have several users.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([("accountNumber", 1)])
+
+    def link(self, line_user_id: str, account_number: str, replace: bool = False) -> bool:
+        """Link a LINE user to an account; False when already linked to another one and not replacing"""
+        fields = {"accountNumber": account_number, "linkedAt": datetime.utcnow()}
+        if replace:
+            self.collection.update_one({"_id": line_user_id}, {"$set": fields}, upsert=True)
+            return True
+
+        result = self.collection.update_one({"_id": line_user_id}, {"$setOnInsert": fields}, upsert=True)
+        if result.upserted_id is not None:
+            return True
+        return self.collection.find_one({"_id": line_user_id, "accountNumber": account_number}, {"_id": 1}) is not None
+
+    def unlink(self, line_user_id: str) -> bool:
+        return self.collection.delete_one({"_id": line_user_id}).deleted_count > 0
+
+    def user_ids_by_account(self, account_numbers: Iterable[str]) -> Dict[str, List[str]]:
+        accounts = sorted(set(account_numbers))
+        user_ids = {}
+        for i in range(0, len(accounts), LOOKUP_CHUNK_SIZE):
+            for doc in self.collection.find(
+                {"accountNumber": {"$in": accounts[i:i + LOOKUP_CHUNK_SIZE]}},
+                {"accountNumber": 1}
+            ):
+                user_ids.setdefault(doc["accountNumber"], []).append(doc["_id"])
+        return user_ids
@@ -0,0 +1,34 @@
+"""
+Create the indexes the API relies on, and build the stats counters, the
+month catalog and the soldier search index the first time
+
+The app no longer builds indexes at import, so run this once per deploy
+(before or alongside the new workers). Every step is idempotent.
+
+Usage: python migrate.py
+"""
+import time
+
+from app import DB_NAME, ensure_indexes, month_catalog, search_index, slip_counters
+
+
+def main():
+    started = time.perf_counter()
+    ensure_indexes()
+    print(f"✅ Indexes up to date on {DB_NAME} ({time.perf_counter() - started:.2f}s)")
+
+    started = time.perf_counter()
+    if slip_counters.ensure_built():
+        print(f"✅ Stats counters built ({time.perf_counter() - started:.2f}s)")
+
+    started = time.perf_counter()
+    if month_catalog.ensure_built():
+        print(f"✅ Month catalog built ({time.perf_counter() - started:.2f}s)")
+
+    started = time.perf_counter()
+    if search_index.ensure_built():
+        print(f"✅ Soldier search index built ({time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Move inline pdfData out of payslip documents into the slip blob store
+
+Safe to re-run: only documents that still carry pdfData are touched.
+Usage: python migrate_blobs.py [--batch-size N]
+"""
+import argparse
+import os
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+from slip_blob_store import SlipBlobStore
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(BASE_DIR, ".env"))
+
+
+def migrate(db, batch_size: int = 100) -> int:
+    payslips_collection = db["payslips"]
+    blob_store = SlipBlobStore(db)
+    migrated = 0
+
+    while True:
+        batch = list(payslips_collection.find(
+            {"pdfData": {"$exists": True}},
+            {"pdfData": 1}
+        ).limit(batch_size))
+        if not batch:
+            break
+
+        blobs = {}
+        operations = []
+        for slip in batch:
+            pdf_bytes = bytes(slip["pdfData"])
+            content_hash = blob_store.content_hash(pdf_bytes)
+            blobs[content_hash] = pdf_bytes
+            operations.append(UpdateOne(
+                {"_id": slip["_id"]},
+                {
+                    "$set": {"pdfHash": content_hash, "pdfSize": len(pdf_bytes)},
+                    "$unset": {"pdfData": ""}
+                }
+            ))
+
+        blob_store.put_many(blobs)
+        payslips_collection.bulk_write(operations, ordered=False)
+        migrated += len(batch)
+        print(f"✅ Migrated {migrated} slips")
+
+    return migrated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    client = MongoClient(os.getenv("MONGO_URI"))
+    db = client[os.getenv("DB_NAME", "payslip_system")]
+    total = migrate(db, args.batch_size)
+    print(f"✅ Done: {total} slips moved to the blob store")
@@ -0,0 +1,67 @@
+import os
+import threading
+
+from pymongo import MongoClient
+
+# Connection pool per worker process. Each gunicorn worker has its own client,
+# so the server sees up to workers * MONGO_MAX_POOL_SIZE connections.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 20))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+
+
+class LazyMongo:
+    """
+    MongoClient created on first use rather than at import
+
+    Constructing a client resolves mongodb+srv:// hosts and starts monitor
+    threads, so a worker that imports the app pays nothing until it touches
+    the database. db["name"] hands out LazyCollection placeholders that can
+    be wired into services at import time.
+    """
+
+    def __init__(self, uri: str, db_name: str):
+        self.uri = uri
+        self.db_name = db_name
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> MongoClient:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(
+                        self.uri,
+                        maxPoolSize=MONGO_MAX_POOL_SIZE,
+                        minPoolSize=MONGO_MIN_POOL_SIZE,
+                        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+                        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS
+                    )
+        return self._client
+
+    @property
+    def database(self):
+        return self.client[self.db_name]
+
+    @property
+    def connected(self) -> bool:
+        return self._client is not None
+
+    def __getitem__(self, name: str) -> "LazyCollection":
+        return LazyCollection(self, name)
+
+
+class LazyCollection:
+    """Stands in for a pymongo Collection; the client is created on the first operation"""
+
+    def __init__(self, mongo: LazyMongo, name: str):
+        self.mongo = mongo
+        self.name = name
+        self._collection = None
+
+    def __getattr__(self, attr):
+        if self._collection is None:
+            self._collection = self.mongo.database[self.name]
+        return getattr(self._collection, attr)
@@ -0,0 +1,90 @@
+from datetime import datetime
+from typing import Dict, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+
+META_ID = "_meta"
+
+
+class MonthCatalog:
+    """
+    Slip counts per (year, month), maintained as slips are written and deleted
+
+    One small document per month ({_id: "2568-05", year, month, slipCount})
+    so /api/available-months never aggregates the payslips collection. A
+    _meta document marks a complete build; migrate.py makes the first one.
+    """
+
+    def __init__(self, collection, payslips_collection):
+        self.collection = collection
+        self.payslips_collection = payslips_collection
+
+    @staticmethod
+    def month_id(year: str, month: str) -> str:
+        return f"{year}-{month}"
+
+    def apply(self, deltas: Dict[Tuple[str, str], int]):
+        """Add slip count deltas keyed by (year, month); empty months are dropped"""
+        changed = {self.month_id(year, month): (year, month, delta) for (year, month), delta in deltas.items() if delta}
+        if not changed:
+            return
+
+        self.collection.bulk_write([
+            UpdateOne(
+                {"_id": month_id},
+                {"$inc": {"slipCount": delta}, "$set": {"year": year, "month": month}},
+                upsert=True
+            )
+            for month_id, (year, month, delta) in changed.items()
+        ], ordered=False)
+        self.collection.delete_many({"_id": {"$in": list(changed)}, "slipCount": {"$lte": 0}})
+
+    def drop_month(self, year: str, month: str):
+        self.collection.delete_one({"_id": self.month_id(year, month)})
+
+    def months(self) -> Dict[str, Dict[str, int]]:
+        """{year: {month: slipCount}}; empty until built, check is_built() first"""
+        catalog = {}
+        for doc in self.collection.find({"slipCount": {"$gt": 0}}):
+            catalog.setdefault(doc["year"], {})[doc["month"]] = doc["slipCount"]
+        return catalog
+
+    def rebuild(self) -> int:
+        """
+        Recount every month from the payslips collection; returns the month count
+
+        Months are replaced in place and only months no longer in payslips
+        are deleted, so readers never see an empty catalog, and workers
+        rebuilding at the same time just write the same documents.
+        """
+        pipeline = [
+            {"$group": {"_id": {"year": "$year", "month": "$month"}, "slipCount": {"$sum": 1}}}
+        ]
+        months = [
+            {
+                "_id": self.month_id(item["_id"]["year"], item["_id"]["month"]),
+                "year": item["_id"]["year"],
+                "month": item["_id"]["month"],
+                "slipCount": item["slipCount"]
+            }
+            for item in self.payslips_collection.aggregate(pipeline)
+        ]
+
+        if months:
+            self.collection.bulk_write(
+                [ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in months],
+                ordered=False
+            )
+        self.collection.delete_many({"_id": {"$nin": [doc["_id"] for doc in months] + [META_ID]}})
+        self.collection.replace_one({"_id": META_ID}, {"builtAt": datetime.utcnow()}, upsert=True)
+        return len(months)
+
+    def is_built(self) -> bool:
+        return self.collection.find_one({"_id": META_ID}, {"_id": 1}) is not None
+
+    def ensure_built(self) -> bool:
+        """Build the catalog if it never was (migrate.py); True when a build ran"""
+        if self.is_built():
+            return False
+        self.rebuild()
+        return True
@@ -0,0 +1,102 @@
+import base64
+import itertools
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+# Upper bound on ?limit; pages are streamed from the cursor one batch at a
+# time, so this bounds response size rather than memory
+MAX_PAGE_SIZE = 5000
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Opaque next-page token for the sort key values of the last item"""
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, *types: type) -> List[Any]:
+    """Sort key values of a next-page token, one of each of the given types"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise CursorError("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise CursorError("invalid cursor")
+    if not all(isinstance(value, kind) for value, kind in zip(values, types)):
+        raise CursorError("invalid cursor")
+    return values
+
+
+def after_filter(*key: Tuple[str, Any]) -> Dict[str, Any]:
+    """
+    Filter for documents after the given sort key position, all fields descending
+
+    after_filter(("uploadedAt", t), ("_id", oid)) matches uploadedAt < t, or
+    uploadedAt == t and _id < oid, which a compound index on the same fields
+    serves as a range scan.
+    """
+    branches = []
+    for i, (field, value) in enumerate(key):
+        branch = {prefix_field: prefix_value for prefix_field, prefix_value in key[:i]}
+        branch[field] = {"$lt": value}
+        branches.append(branch)
+    return {"$or": branches}
+
+
+def parse_limit(value, default: int) -> int:
+    limit = int(value) if value not in (None, "") else default
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def open_page(items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    Start reading items before any of the response is sent
+
+    Taking the first item runs the query and fetches its first batch, so
+    query errors still reach the route's error handling instead of cutting
+    off a 200 response mid-stream. The rest is read from the live cursor as
+    the page streams.
+    """
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        return iter(())
+    return itertools.chain([first], items)
+
+
+def stream_page(field: str, items: Iterable[Dict[str, Any]], limit: int,
+                cursor_of: Callable[[Dict[str, Any]], List[Any]],
+                render: Callable[[Dict[str, Any]], Any],
+                dumps: Callable[[Any], str]) -> Iterator[str]:
+    """
+    Stream {"success": true, field: [...], "nextCursor": ...} one item at a time
+
+    items are raw documents in sort order and may run past the page; one
+    extra item is read to tell whether there is a next page. cursor_of gives
+    the sort key values of a raw document, render its JSON-ready form.
+    nextCursor is null on the last page.
+    """
+    yield '{"success":true,' + dumps(field) + ":["
+    last_key = None
+    count = 0
+    has_more = False
+    for item in items:
+        if count == limit:
+            has_more = True
+            break
+        if count:
+            yield ","
+        # Key first: render may convert the sort fields in place
+        last_key = cursor_of(item)
+        yield dumps(render(item))
+        count += 1
+
+    next_cursor = encode_cursor(last_key) if has_more else None
+    yield '],"nextCursor":' + dumps(next_cursor) + "}"
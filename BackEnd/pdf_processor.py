@@ -1,7 +1,58 @@
 import fitz  # PyMuPDF
+import hashlib
 import re
 import io
-from typing import List, Dict, Any,Optional
+import os
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Callable, Iterator, Optional
+
+# Documents with fewer pages than this are always split serially; spinning up
+# a process pool costs more than it saves on a handful of pages.
+PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 32))
+
+# Pages per task handed to a pool worker
+PARALLEL_CHUNK_PAGES = int(os.getenv("PDF_PARALLEL_CHUNK_PAGES", 8))
+
+# Compact slip output: subset the embedded fonts to the glyphs the slip uses,
+# drop unused and duplicate objects, and deflate every stream
+COMPACT_OUTPUT = os.getenv("PDF_COMPACT_OUTPUT", "1").lower() in ("1", "true")
+COMPACT_WRITE_OPTIONS = {
+    "garbage": 4,
+    "deflate": True,
+    "deflate_images": True,
+    "deflate_fonts": True,
+}
+
+# Source bytes for the current pool worker, set once by _init_worker so each
+# page-range task only ships its (start, end) bounds across the process boundary.
+_worker_pdf_content = None
+
+
+def _init_worker(pdf_content: bytes):
+    global _worker_pdf_content
+    _worker_pdf_content = pdf_content
+
+
+def _process_page_range(start: int, end: int, year: str, month: str,
+                        compact: bool) -> List[Dict[str, Any]]:
+    """Split pages [start, end) of the worker's source document"""
+    processor = PDFProcessor(compact=compact)
+    doc = fitz.open(stream=_worker_pdf_content, filetype="pdf")
+    try:
+        return processor.process_page_range(doc, start, end, year, month)
+    finally:
+        doc.close()
+
+
+def default_worker_count() -> int:
+    """Worker count from PDF_WORKERS, falling back to the number of CPUs"""
+    workers = os.getenv("PDF_WORKERS")
+    if workers:
+        return max(1, int(workers))
+    return os.cpu_count() or 1
 
 class PDFProcessor:
     """Process Thai military payslips PDF files"""
@@ -20,30 +71,102 @@ class PDFProcessor:
         "จ่าสิบตรี", "จ่าสิบโท", "จ่าสิบเอก", "สิบตรี", "สิบโท", "สิบเอก"
     ]
     
-    def __init__(self):
+    def __init__(self, compact: Optional[bool] = None):
         self.rank_pattern = '|'.join(re.escape(rank) for rank in self.RANKS)
+        self.compact = COMPACT_OUTPUT if compact is None else compact
     
-    def process_pdf(self, pdf_content: bytes) -> List[Dict[str, Any]]:
+    def process_pdf(self, pdf_content: bytes, workers: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Process a PDF file containing multiple payslips
         Returns a list of dictionaries, each containing slip data
+
+        Holds every slip (including its PDF bytes) at once; prefer
+        iter_slips() when the slips are consumed one batch at a time.
+        """
+        return list(self.iter_slips(pdf_content, workers=workers))
+
+    def iter_slips(self, pdf_content: bytes, workers: Optional[int] = None,
+                   progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield slips one by one, in page order
+
+        workers: number of processes used to split pages. Defaults to
+        default_worker_count(); 1 (or a document shorter than
+        PARALLEL_MIN_PAGES) keeps everything in the calling process.
+        Only a bounded window of page ranges is ever in flight, so memory
+        does not grow with the size of the document.
+        progress: optional callback receiving (pages_done, page_count).
         """
         doc = fitz.open(stream=pdf_content, filetype="pdf")
         
-        # First, extract month and year from the document
-        year, month = self.extract_month_year_from_document(doc)
-        
+        try:
+            # First, extract month and year from the document
+            year, month = self.extract_month_year_from_document(doc)
+            page_count = len(doc)
+
+            if workers is None:
+                workers = default_worker_count()
+            workers = min(workers, page_count)
+
+            if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+                for page_num in range(page_count):
+                    page = doc.load_page(page_num)
+                    yield from self.split_page_to_slips(doc, page, page_num, year, month)
+                    if progress:
+                        progress(page_num + 1, page_count)
+                return
+        finally:
+            doc.close()
+
+        yield from self._iter_parallel(pdf_content, page_count, year, month, workers, progress)
+
+    def process_page_range(self, doc, start: int, end: int, year: str, month: str) -> List[Dict[str, Any]]:
+        """Split pages [start, end) of an open document into slips"""
         slips = []
         
-        for page_num in range(len(doc)):
+        for page_num in range(start, end):
             page = doc.load_page(page_num)
             
             # Split page into two halves (top and bottom)
             page_slips = self.split_page_to_slips(doc, page, page_num, year, month)
             slips.extend(page_slips)
         
-        doc.close()
         return slips
+
+    def _iter_parallel(self, pdf_content: bytes, page_count: int, year: str, month: str,
+                       workers: int, progress: Optional[Callable[[int, int], None]] = None
+                       ) -> Iterator[Dict[str, Any]]:
+        """Split contiguous page ranges across a process pool, keeping page order"""
+        ranges = (
+            (start, min(start + PARALLEL_CHUNK_PAGES, page_count))
+            for start in range(0, page_count, PARALLEL_CHUNK_PAGES)
+        )
+
+        # spawn rather than fork: forking a threaded gunicorn worker that has
+        # MuPDF and pymongo state loaded is not safe
+        ctx = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                   initializer=_init_worker, initargs=(pdf_content,))
+        try:
+            # Keep two ranges per worker in flight; results are consumed
+            # oldest-first so output matches page order
+            pending = deque(
+                (end, pool.submit(_process_page_range, start, end, year, month, self.compact))
+                for start, end in itertools.islice(ranges, workers * 2)
+            )
+            while pending:
+                end, future = pending.popleft()
+                range_slips = future.result()
+                next_range = next(ranges, None)
+                if next_range:
+                    pending.append((next_range[1], pool.submit(
+                        _process_page_range, *next_range, year, month, self.compact
+                    )))
+                yield from range_slips
+                if progress:
+                    progress(end, page_count)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
     
     def extract_month_year_from_document(self, doc) -> tuple:
         """Extract month and year from the first few pages of the document"""
@@ -64,7 +187,13 @@ class PDFProcessor:
         raise ValueError("ไม่พบข้อมูลเดือนและปีในเอกสาร")
     
     def split_page_to_slips(self, doc, page, page_num: int, year: str, month: str) -> List[Dict[str, Any]]:
-        """Split a single page into individual payslips"""
+        """
+        Split a single page into individual payslips
+
+        Text is read straight from each clip region of the source page first;
+        a slip PDF is only built for halves that carry an account number, so
+        blank halves and cover pages never allocate a document.
+        """
         rect = page.rect
         mid_y = rect.y0 + rect.height / 2
         
@@ -76,33 +205,19 @@ class PDFProcessor:
             fitz.Rect(rect.x0, mid_y, rect.x1, rect.y1)    # Bottom half
         ]
         
-        for i, clip_rect in enumerate(halves):
-            # Create new document for this slip
-            new_doc = fitz.open()
-            new_page = new_doc.new_page(width=clip_rect.width, height=clip_rect.height)
-            new_page.show_pdf_page(
-                fitz.Rect(0, 0, clip_rect.width, clip_rect.height),
-                doc,
-                page.number,
-                clip=clip_rect
-            )
-            
-            # Extract text from the slip
-            text = new_page.get_text()
+        for clip_rect in halves:
+            # Phase 1: extract text and fields from the source page region
+            text = page.get_text(clip=clip_rect)
             
-            # Extract account number and other data
             account_number = self.extract_account_number(text)
             if not account_number:
-                new_doc.close()
                 continue  # Skip if no account number found
             
-            # Extract additional information
             rank = self.extract_rank(text)
             name = self.extract_name(text)
             
-            # Save PDF as bytes
-            pdf_bytes = new_doc.write()
-            new_doc.close()
+            # Phase 2: only now render the half into its own PDF
+            pdf_bytes = self.build_slip_pdf(doc, page.number, clip_rect)
             
             # Create slip data
             slip_data = {
@@ -112,12 +227,46 @@ class PDFProcessor:
                 'rank': rank,
                 'name': name,
                 'pdfData': pdf_bytes,
-                'fileName': f"{account_number}_{year}_{month}.pdf"
+                'fileName': f"{account_number}_{year}_{month}.pdf",
+                'fingerprint': self.slip_fingerprint(text, pdf_bytes)
             }
             
             slips.append(slip_data)
         
         return slips
+
+    def build_slip_pdf(self, doc, page_number: int, clip_rect) -> bytes:
+        """Render one clip region of a source page into a standalone PDF"""
+        new_doc = fitz.open()
+        try:
+            new_page = new_doc.new_page(width=clip_rect.width, height=clip_rect.height)
+            new_page.show_pdf_page(
+                fitz.Rect(0, 0, clip_rect.width, clip_rect.height),
+                doc,
+                page_number,
+                clip=clip_rect
+            )
+            # no_new_id keeps the trailer /ID stable, so identical input
+            # always produces identical bytes (and the same fingerprint)
+            if not self.compact:
+                return new_doc.write(no_new_id=True)
+
+            try:
+                new_doc.subset_fonts()
+            except Exception as e:
+                # A font MuPDF can't subset is still written, just whole
+                print(f"⚠️ Font subsetting failed on page {page_number + 1}: {e}")
+            return new_doc.write(no_new_id=True, **COMPACT_WRITE_OPTIONS)
+        finally:
+            new_doc.close()
+
+    @staticmethod
+    def slip_fingerprint(text: str, pdf_bytes: bytes) -> str:
+        """SHA-256 over a slip's extracted text and PDF bytes"""
+        digest = hashlib.sha256(text.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(pdf_bytes)
+        return digest.hexdigest()
     
     def extract_account_number(self, text: str) -> str:
         """Extract account number from text"""
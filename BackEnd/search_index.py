@@ -0,0 +1,195 @@
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Set
+
+from pymongo import ReplaceOne, UpdateOne
+
+from slip_ingestor import batched
+
+META_ID = "_meta"
+
+# Character n-gram length for name tokens. Thai is written without spaces
+# between syllables, so substring matching needs n-grams rather than words.
+NGRAM = 3
+
+# Soldier documents written per bulk_write while rebuilding
+REBUILD_BATCH_SIZE = 1000
+
+
+def name_words(text: str) -> List[str]:
+    return text.split() if text else []
+
+
+def name_tokens(name: str) -> Set[str]:
+    """
+    Index tokens for a name
+
+    Every NGRAM-character window of each word, plus "^"-prefixed word
+    prefixes shorter than NGRAM so one- and two-letter queries still hit
+    the index.
+    """
+    tokens = set()
+    for word in name_words(name):
+        for length in range(1, min(NGRAM, len(word) + 1)):
+            tokens.add("^" + word[:length])
+        for i in range(len(word) - NGRAM + 1):
+            tokens.add(word[i:i + NGRAM])
+    return tokens
+
+
+def query_tokens(term: str) -> Set[str]:
+    """Tokens every matching name must carry; a superset of the real matches"""
+    tokens = set()
+    for word in name_words(term):
+        if len(word) < NGRAM:
+            tokens.add("^" + word)
+        else:
+            tokens.update(word[i:i + NGRAM] for i in range(len(word) - NGRAM + 1))
+    return tokens
+
+
+class SoldierSearchIndex:
+    """
+    One search document per soldier, built at ingest time
+
+    {_id: accountNumber, name, rank, tokens: [...], months: ["2568-05", ...]}
+    Name queries are a $all lookup on the multikey tokens index, then
+    checked for real substring matches; account queries are an anchored
+    prefix on _id. Both are index scans, and results are per soldier rather
+    than per payslip.
+    """
+
+    def __init__(self, collection, payslips_collection):
+        self.collection = collection
+        self.payslips_collection = payslips_collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([("latest", -1), ("_id", -1)])
+        self.collection.create_index([("tokens", 1), ("latest", -1), ("_id", -1)])
+
+    @staticmethod
+    def period(year: str, month: str) -> str:
+        return f"{year}-{month}"
+
+    def add_slips(self, slips: Iterable[Dict[str, Any]]):
+        """Record written slips; a soldier's newest month sets the name and rank, as in rebuild()"""
+        months, names = [], []
+        for slip_data in slips:
+            period = self.period(slip_data["year"], slip_data["month"])
+            name = slip_data.get("name") or ""
+            months.append(UpdateOne(
+                {"_id": slip_data["accountNumber"]},
+                {"$addToSet": {"months": period}, "$max": {"latest": period}},
+                upsert=True
+            ))
+            # Matches only when this month is (now) the soldier's latest, so
+            # re-uploading an older month doesn't bring back an old name
+            names.append(UpdateOne(
+                {"_id": slip_data["accountNumber"], "latest": period},
+                {"$set": {
+                    "name": name,
+                    "rank": slip_data.get("rank", ""),
+                    "tokens": sorted(name_tokens(name))
+                }}
+            ))
+        if months:
+            self.collection.bulk_write(months, ordered=False)
+            self.collection.bulk_write(names, ordered=False)
+
+    def remove_slip(self, account_number: str, year: str, month: str):
+        self.remove_month(year, month, [account_number])
+
+    def remove_month(self, year: str, month: str, account_numbers: List[str] = None):
+        """Forget a month (optionally only for some soldiers); drop soldiers left with none"""
+        period = self.period(year, month)
+        query = {"months": period}
+        if account_numbers is not None:
+            query["_id"] = {"$in": account_numbers}
+
+        affected = [doc["_id"] for doc in self.collection.find(query, {"_id": 1})]
+        if not affected:
+            return
+
+        self.collection.update_many({"_id": {"$in": affected}}, {"$pull": {"months": period}})
+        self.collection.delete_many({"_id": {"$in": affected}, "months": {"$size": 0}})
+        # latest may have pointed at the removed month; one server-side update
+        # for all of them. name/rank stay those of the removed month until
+        # the next upload or rebuild, since the index keeps no per-month names
+        self.collection.update_many(
+            {"_id": {"$in": affected}, "latest": period},
+            [{"$set": {"latest": {"$max": "$months"}}}]
+        )
+
+    def search(self, term: str, after: Dict[str, Any] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Matching soldiers, newest month first then by account number
+
+        after is an extra filter (a keyset position) ANDed into the query.
+        The cursor is read lazily, so callers take as many results as they need.
+        """
+        term = " ".join(term.split())
+        digits = term.replace("-", "").replace(" ", "")
+        by_account = digits.isdigit()
+
+        if by_account:
+            query = {"_id": {"$regex": "^" + re.escape(digits)}}
+        else:
+            tokens = query_tokens(term)
+            if not tokens:
+                return
+            query = {"tokens": {"$all": sorted(tokens)}}
+        if after:
+            query = {"$and": [query, after]}
+
+        words = name_words(term)
+        cursor = self.collection.find(query, {"tokens": 0}).sort([("latest", -1), ("_id", -1)])
+        for doc in cursor:
+            # n-gram hits are candidates; keep names that really contain every word
+            if by_account or all(word in doc.get("name", "") for word in words):
+                yield doc
+
+    def rebuild(self) -> int:
+        """Rebuild every soldier document from payslips; returns the soldier count"""
+        pipeline = [
+            {"$sort": {"year": 1, "month": 1}},
+            {"$group": {
+                "_id": "$accountNumber",
+                "name": {"$last": "$name"},
+                "rank": {"$last": "$rank"},
+                "years": {"$push": "$year"},
+                "monthNumbers": {"$push": "$month"}
+            }}
+        ]
+
+        soldiers = []
+        for batch in batched(self.payslips_collection.aggregate(pipeline, allowDiskUse=True), REBUILD_BATCH_SIZE):
+            operations = []
+            for item in batch:
+                months = sorted({
+                    self.period(year, month)
+                    for year, month in zip(item["years"], item["monthNumbers"])
+                })
+                name = item.get("name") or ""
+                soldiers.append(item["_id"])
+                operations.append(ReplaceOne({"_id": item["_id"]}, {
+                    "name": name,
+                    "rank": item.get("rank") or "",
+                    "tokens": sorted(name_tokens(name)),
+                    "months": months,
+                    "latest": months[-1]
+                }, upsert=True))
+            self.collection.bulk_write(operations, ordered=False)
+
+        self.collection.delete_many({"_id": {"$nin": soldiers + [META_ID]}})
+        self.collection.replace_one({"_id": META_ID}, {"builtAt": datetime.utcnow()}, upsert=True)
+        return len(soldiers)
+
+    def is_built(self) -> bool:
+        return self.collection.find_one({"_id": META_ID}, {"_id": 1}) is not None
+
+    def ensure_built(self) -> bool:
+        """Build the index if it never was (migrate.py); True when a build ran"""
+        if self.is_built():
+            return False
+        self.rebuild()
+        return True
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical lookups within a process
+
+    While one thread runs fn for a key, other threads asking for the same key
+    wait for that run and share its result (or exception) instead of issuing
+    their own query. Nothing is kept once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"executed": self.executed, "shared": self.shared, "inFlight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop
+
+    Used by the ASGI handlers; no lock needed since everything runs on the
+    loop thread.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.executed = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            # shield: one waiter being cancelled mustn't cancel the shared call
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        self.executed += 1
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark it retrieved so a call nobody shared doesn't log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"executed": self.executed, "shared": self.shared, "inFlight": len(self._calls)}
@@ -0,0 +1,86 @@
+import hashlib
+from typing import Dict, Iterable
+
+import gridfs
+from gridfs.errors import FileExists, NoFile
+from pymongo.errors import DuplicateKeyError
+
+from mongo import LazyMongo
+
+
+class SlipBlobStore:
+    """
+    Slip PDF bytes kept in a GridFS bucket, keyed by SHA-256 of the content
+
+    Payslip documents only carry pdfHash/pdfSize, so metadata queries never
+    page PDF bytes into the working set. Identical PDFs share one blob.
+    """
+
+    def __init__(self, db, bucket_name: str = "slip_blobs"):
+        self.db = db
+        self.bucket_name = bucket_name
+        self.files = db[f"{bucket_name}.files"]
+        self._bucket = None
+
+    @property
+    def bucket(self) -> gridfs.GridFSBucket:
+        # Built on first use: a bucket needs a live Database, which a
+        # LazyMongo only creates when something touches it
+        if self._bucket is None:
+            db = self.db.database if isinstance(self.db, LazyMongo) else self.db
+            self._bucket = gridfs.GridFSBucket(db, bucket_name=self.bucket_name)
+        return self._bucket
+
+    @staticmethod
+    def content_hash(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data: bytes) -> str:
+        """Store data if it isn't stored yet, returns its hash"""
+        content_hash = self.content_hash(data)
+        if not self.files.find_one({"_id": content_hash}, {"_id": 1}):
+            self._upload(content_hash, data)
+        return content_hash
+
+    def put_many(self, blobs: Dict[str, bytes]):
+        """Store {hash: bytes} pairs, with one lookup for the whole batch"""
+        existing = {doc["_id"] for doc in self.files.find({"_id": {"$in": list(blobs)}}, {"_id": 1})}
+        for content_hash, data in blobs.items():
+            if content_hash not in existing:
+                self._upload(content_hash, data)
+
+    def _upload(self, content_hash: str, data: bytes):
+        try:
+            self.bucket.upload_from_stream_with_id(content_hash, content_hash, data)
+        except (FileExists, DuplicateKeyError):
+            pass  # stored concurrently by another upload; same bytes
+
+    def open(self, content_hash: str):
+        """Seekable file-like GridOut for streaming a blob"""
+        return self.bucket.open_download_stream(content_hash)
+
+    def read(self, content_hash: str) -> bytes:
+        return self.open(content_hash).read()
+
+    def release(self, hashes: Iterable[str], payslips_collection):
+        """
+        Delete blobs no payslip document refers to any more
+
+        Check-then-delete is not atomic: an upload that found a blob stored
+        and then points a payslip at it could race this delete. Uploads
+        re-check their blobs after writing payslips (SlipIngestor), which
+        leaves only a delete landing between that re-check and the
+        distinct() below.
+        """
+        hashes = [content_hash for content_hash in set(hashes) if content_hash]
+        if not hashes:
+            return
+        # One query for the whole batch instead of a lookup per hash
+        referenced = set(payslips_collection.distinct("pdfHash", {"pdfHash": {"$in": hashes}}))
+        for content_hash in hashes:
+            if content_hash in referenced:
+                continue
+            try:
+                self.bucket.delete(content_hash)
+            except NoFile:
+                pass
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Per-process budget for cached slip bytes; each gunicorn worker has its own
+SLIP_CACHE_BYTES = int(os.getenv("SLIP_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Upper bound on how long another worker's upload can leave a stale entry here
+SLIP_CACHE_TTL = int(os.getenv("SLIP_CACHE_TTL", 300))
+
+
+class SlipCache:
+    """
+    Byte-budgeted LRU cache of slips keyed by (accountNumber, year, month)
+
+    Entries are slip documents with their PDF bytes in pdfData. Entry size
+    is the PDF length, so the budget bounds memory rather than entry count.
+    """
+
+    def __init__(self, max_bytes: int = None, ttl: int = None):
+        self.max_bytes = SLIP_CACHE_BYTES if max_bytes is None else max_bytes
+        self.ttl = SLIP_CACHE_TTL if ttl is None else ttl
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(account: str, year: str, month: str) -> Tuple[str, str, str]:
+        return str(account), str(year), str(month).zfill(2)
+
+    def get(self, key) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, slip: Dict[str, Any]):
+        size = len(slip.get("pdfData") or b"")
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), size, slip)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_month(self, year: str, month: str):
+        month_key = (str(year), str(month).zfill(2))
+        with self._lock:
+            for key in [key for key in self._entries if key[1:] == month_key]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
@@ -0,0 +1,114 @@
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable
+
+from pymongo import ReplaceOne, UpdateOne
+
+from slip_ingestor import batched
+
+GLOBAL_ID = "global"
+
+# Account documents written per bulk_write while reconciling
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", 1000))
+
+
+class SlipCounters:
+    """
+    Running totals for /api/stats, updated by ingestion and deletion
+
+    accounts holds {_id: accountNumber, slipCount}; an account document
+    exists exactly while the account has slips, so the number of accounts
+    created or removed by a write is the change in uniqueAccounts. Totals
+    live in a single counters document and are read in O(1). The first
+    baseline is built by migrate.py, never by a request.
+    """
+
+    def __init__(self, counters_collection, accounts_collection, payslips_collection):
+        self.counters = counters_collection
+        self.accounts = accounts_collection
+        self.payslips_collection = payslips_collection
+
+    def add_slips(self, account_numbers: Iterable[str]):
+        """Count newly inserted slips"""
+        per_account = Counter(account_numbers)
+        if not per_account:
+            return
+
+        result = self.accounts.bulk_write([
+            UpdateOne({"_id": account}, {"$inc": {"slipCount": count}}, upsert=True)
+            for account, count in per_account.items()
+        ], ordered=False)
+        self._inc(sum(per_account.values()), result.upserted_count)
+
+    def remove_slips(self, account_numbers: Iterable[str]):
+        """Count deleted slips"""
+        per_account = Counter(account_numbers)
+        if not per_account:
+            return
+
+        self.accounts.bulk_write([
+            UpdateOne({"_id": account}, {"$inc": {"slipCount": -count}})
+            for account, count in per_account.items()
+        ], ordered=False)
+        emptied = self.accounts.delete_many({
+            "_id": {"$in": list(per_account)},
+            "slipCount": {"$lte": 0}
+        })
+        self._inc(-sum(per_account.values()), -emptied.deleted_count)
+
+    def totals(self) -> Dict[str, int]:
+        """Zeros until a baseline is built; check is_built() first"""
+        doc = self.counters.find_one({"_id": GLOBAL_ID}) or {}
+        return {"totalSlips": doc.get("totalSlips", 0), "uniqueAccounts": doc.get("uniqueAccounts", 0)}
+
+    def reconcile(self) -> Dict[str, int]:
+        """
+        Recount everything from payslips; corrects any drift
+
+        Account documents are replaced in place rather than swapping in a
+        new collection with $out, so $incs from uploads running meanwhile
+        land on documents that stay, and only accounts that really have no
+        slips left are deleted.
+        """
+        pipeline = [{"$group": {"_id": "$accountNumber", "slipCount": {"$sum": 1}}}]
+        accounts = []
+        for batch in batched(self.payslips_collection.aggregate(pipeline, allowDiskUse=True), RECONCILE_BATCH_SIZE):
+            accounts.extend(item["_id"] for item in batch)
+            self.accounts.bulk_write([
+                ReplaceOne({"_id": item["_id"]}, {"slipCount": item["slipCount"]}, upsert=True)
+                for item in batch
+            ], ordered=False)
+
+        # An account missing from the recount may have been created by an
+        # upload after the aggregation read payslips; keep it if so
+        stale = self.accounts.distinct("_id", {"_id": {"$nin": accounts}})
+        if stale:
+            still_used = self.payslips_collection.distinct("accountNumber", {"accountNumber": {"$in": stale}})
+            self.accounts.delete_many({"_id": {"$in": list(set(stale) - set(still_used))}})
+
+        doc = {
+            "totalSlips": self.payslips_collection.count_documents({}),
+            "uniqueAccounts": self.accounts.count_documents({}),
+            "reconciledAt": datetime.utcnow()
+        }
+        self.counters.replace_one({"_id": GLOBAL_ID}, doc, upsert=True)
+        return doc
+
+    def is_built(self) -> bool:
+        return self.counters.find_one({"_id": GLOBAL_ID}, {"_id": 1}) is not None
+
+    def ensure_built(self) -> bool:
+        """Build the baseline if it never was (migrate.py); True when a build ran"""
+        if self.is_built():
+            return False
+        self.reconcile()
+        return True
+
+    def _inc(self, slips: int, accounts: int):
+        # No upsert: until the first reconcile() (migrate.py) there is no
+        # baseline to add to
+        self.counters.update_one(
+            {"_id": GLOBAL_ID},
+            {"$inc": {"totalSlips": slips, "uniqueAccounts": accounts}}
+        )
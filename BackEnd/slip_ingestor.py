@@ -0,0 +1,170 @@
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Number of slips written to MongoDB per bulk_write during upload
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 100))
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def batched(iterable, size):
+    """Yield lists of up to size items from iterable"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class SlipIngestor:
+    """
+    Write extracted slips to the payslips collection with bulk upserts
+
+    PDF bytes go to the blob store; payslip documents keep only pdfHash and
+    pdfSize next to the slip metadata. on_written, if given, is called after
+    every batch with the lists of inserted and updated slips, so derived
+    data (catalogs, counters, indexes) can follow the writes.
+    """
+
+    def __init__(self, collection, blob_store, batch_size: int = None,
+                 on_written: Optional[Callable[[List[Dict[str, Any]], List[Dict[str, Any]]], None]] = None):
+        self.collection = collection
+        self.blob_store = blob_store
+        self.batch_size = batch_size or INGEST_BATCH_SIZE
+        self.on_written = on_written
+
+    def ingest(self, slips: Iterable[Dict[str, Any]],
+               progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Upsert slips batch by batch, keyed on (accountNumber, year, month)
+
+        Returns inserted/updated/unchanged/total counts plus the year and
+        month of the first slip (used for the LINE notification). progress,
+        if given, is called with the running result after every batch.
+        """
+        result = {"inserted": 0, "updated": 0, "unchanged": 0, "total": 0, "year": None, "month": None}
+
+        for batch in batched(slips, self.batch_size):
+            if result["month"] is None:
+                result["year"] = batch[0]["year"]
+                result["month"] = batch[0]["month"]
+
+            for key, count in self.write_batch(batch).items():
+                result[key] += count
+            result["total"] += len(batch)
+            if progress:
+                progress(result)
+
+        return result
+
+    def write_batch(self, batch: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Upsert one batch in a single unordered bulk_write
+
+        Slips whose stored fingerprint matches are left untouched, so a
+        corrected roster only rewrites the slips that actually changed.
+        """
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+        stored = self.stored_slips(batch)
+        uploaded_at = datetime.utcnow()
+        updates = []
+        written = []
+        blobs = {}
+        replaced_hashes = []
+
+        for slip_data in batch:
+            previous = stored.get(self.slip_key_tuple(slip_data), {})
+            fingerprint = slip_data.get("fingerprint")
+            if fingerprint and previous.get("fingerprint") == fingerprint:
+                counts["unchanged"] += 1
+                continue
+
+            pdf_bytes = slip_data.pop("pdfData")
+            content_hash = self.blob_store.content_hash(pdf_bytes)
+            blobs[content_hash] = pdf_bytes
+            if previous.get("pdfHash") not in (None, content_hash):
+                replaced_hashes.append(previous["pdfHash"])
+
+            slip_data["pdfHash"] = content_hash
+            slip_data["pdfSize"] = len(pdf_bytes)
+            slip_data["uploadedAt"] = uploaded_at
+            # $unset drops inline bytes left on documents written before the blob store
+            updates.append((self.slip_key(slip_data), {"$set": slip_data, "$unset": {"pdfData": ""}}))
+            written.append(slip_data)
+
+        if not updates:
+            return counts
+
+        # Blobs first, so a payslip never points at a hash that isn't stored
+        self.blob_store.put_many(blobs)
+
+        try:
+            result = self.collection.bulk_write(
+                [UpdateOne(key, update, upsert=True) for key, update in updates],
+                ordered=False
+            )
+            inserted_indexes = set(result.upserted_ids)
+        except BulkWriteError as e:
+            details = e.details
+            inserted_indexes = {upserted["index"] for upserted in details.get("upserted", [])}
+
+            # Two upserts racing on the same key (another upload of the same
+            # month) lose to the unique index; the document exists now, so
+            # retrying turns the upsert into an update.
+            for error in details.get("writeErrors", []):
+                if error.get("code") != DUPLICATE_KEY_ERROR:
+                    raise
+                key, update = updates[error["index"]]
+                self.collection.update_one(key, update, upsert=True)
+
+        # A concurrent release() may have deleted a blob we found stored
+        # before these payslips pointed at it; store it again if so
+        self.blob_store.put_many(blobs)
+
+        inserted = [slip_data for i, slip_data in enumerate(written) if i in inserted_indexes]
+        updated = [slip_data for i, slip_data in enumerate(written) if i not in inserted_indexes]
+        counts["inserted"] += len(inserted)
+        counts["updated"] += len(updated)
+
+        self.blob_store.release(replaced_hashes, self.collection)
+        if self.on_written:
+            self.on_written(inserted, updated)
+        return counts
+
+    def stored_slips(self, batch: List[Dict[str, Any]]) -> Dict[tuple, Dict[str, Any]]:
+        """Stored fingerprint and pdfHash for the slips in a batch, by slip_key_tuple"""
+        accounts_by_month = {}
+        for slip_data in batch:
+            month_key = (slip_data["year"], slip_data["month"])
+            accounts_by_month.setdefault(month_key, []).append(slip_data["accountNumber"])
+
+        stored = {}
+        for (year, month), accounts in accounts_by_month.items():
+            cursor = self.collection.find(
+                {"accountNumber": {"$in": accounts}, "year": year, "month": month},
+                {"_id": 0, "accountNumber": 1, "fingerprint": 1, "pdfHash": 1}
+            )
+            for doc in cursor:
+                stored[(doc["accountNumber"], year, month)] = doc
+
+        return stored
+
+    @staticmethod
+    def slip_key_tuple(slip_data: Dict[str, Any]) -> tuple:
+        return slip_data["accountNumber"], slip_data["year"], slip_data["month"]
+
+    @staticmethod
+    def slip_key(slip_data: Dict[str, Any]) -> Dict[str, str]:
+        """Filter matching the unique (accountNumber, year, month) index"""
+        return {
+            "accountNumber": slip_data["accountNumber"],
+            "year": slip_data["year"],
+            "month": slip_data["month"]
+        }
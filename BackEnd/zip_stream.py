@@ -0,0 +1,53 @@
+import shutil
+import zipfile
+from typing import BinaryIO, Iterable, Iterator, Tuple
+
+# PDFs are mostly compressed already; the fastest level keeps CPU low while
+# deflate (unlike stored) stays readable by streaming unzip tools
+ZIP_COMPRESS_LEVEL = 1
+
+
+class _ChunkSink:
+    """
+    Write-only, unseekable file object for zipfile
+
+    No seek(), so zipfile writes each entry's sizes in a data descriptor
+    after its data instead of going back to patch the local header.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries: Iterable[Tuple[str, BinaryIO]]) -> Iterator[bytes]:
+    """
+    Yield a ZIP archive piece by piece from (name, file object) pairs
+
+    Only the entry being written is buffered, so the archive can be any size.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED,
+                         compresslevel=ZIP_COMPRESS_LEVEL) as archive:
+        for name, source in entries:
+            with archive.open(name, "w") as entry:
+                shutil.copyfileobj(source, entry)
+            yield sink.take()
+    # Central directory
+    yield sink.take()